@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Calculate per position conservation profiles from a SIFT4G alignment: amino acid counts, gap
+fraction and Shannon entropy (bits, over non-gap amino acids) for each alignment column.
+Profiles are output as a compact JSON file of column arrays for the frontend, and optionally
+as a TSV table for analysis. As in format_sift_alignment.py, X residues are treated as gaps, as
+are other non-standard residues (e.g. B, Z and U), so gap_fraction is the fraction of sequences
+without a standard amino acid at each position.
+"""
+import sys
+import json
+import argparse
+
+import numpy as np
+from Bio import SeqIO
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+# Map sequence bytes to amino acid indices, with gaps and non-standard residues as 20
+CODES = np.full(256, 20, dtype=np.uint8)
+for _i, _aa in enumerate(AMINO_ACIDS):
+    CODES[ord(_aa)] = CODES[ord(_aa.lower())] = _i
+
+def read_alignment(path, query=None):
+    """
+    Read an aligned FASTA file into a list of names and an (N, L) array of residue codes.
+    The SIFT4G QUERY sequence is renamed to query if given.
+    """
+    names = []
+    sequences = []
+    for record in SeqIO.parse(path, 'fasta'):
+        names.append(query if query and record.id == 'QUERY' else record.id)
+        sequences.append(str(record.seq).encode())
+
+    if not sequences:
+        return names, np.zeros((0, 0), dtype=np.uint8)
+
+    if len({len(i) for i in sequences}) > 1:
+        raise ValueError(f'Sequences in {path} have different lengths, is it aligned?')
+
+    alignment = np.frombuffer(b''.join(sequences), dtype=np.uint8)
+    return names, CODES[alignment.reshape(len(sequences), -1)]
+
+def alignment_profile(codes):
+    """
+    Calculate amino acid counts (L, 20), gap fraction and entropy for each column of an
+    alignment of residue codes
+    """
+    num_seqs, length = codes.shape
+    columns = np.broadcast_to(np.arange(length), codes.shape)
+    counts = np.bincount((columns * 21 + codes).ravel(), minlength=length * 21)
+    counts = counts.reshape(length, 21)
+
+    gap_fraction = counts[:, 20] / num_seqs if num_seqs else np.zeros(length)
+    counts = counts[:, :20]
+    total = counts.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        freqs = counts / total
+        entropy = 0.0 - np.nansum(np.where(freqs > 0, freqs * np.log2(freqs), 0), axis=1)
+    entropy[total[:, 0] == 0] = np.nan
+    return counts, gap_fraction, entropy
+
+def main(args):
+    """Main"""
+    names, codes = read_alignment(args.fasta, args.query)
+    counts, gap_fraction, entropy = alignment_profile(codes)
+
+    query_index = names.index(args.query) if args.query in names else 0
+    query_seq = ''
+    if names:
+        query_seq = ''.join(AMINO_ACIDS[i] if i < 20 else '-' for i in codes[query_index])
+
+    profile = {
+        'query': names[query_index] if names else args.query,
+        'sequences': len(names),
+        'amino_acids': AMINO_ACIDS,
+        'query_sequence': query_seq,
+        'counts': counts.tolist(),
+        'gap_fraction': [round(float(i), 4) for i in gap_fraction],
+        'entropy': [None if np.isnan(i) else round(float(i), 4) for i in entropy]
+    }
+    json.dump(profile, sys.stdout, separators=(',', ':'))
+
+    if args.tsv:
+        with open(args.tsv, 'w') as tsv_file:
+            print('position', 'query', 'sequences', 'gap_fraction', 'entropy',
+                  *AMINO_ACIDS, sep='\t', file=tsv_file)
+            for pos, (aa, gaps, ent, row) in enumerate(zip(query_seq, gap_fraction, entropy,
+                                                           counts), 1):
+                print(pos, aa, len(names), f'{gaps:.4f}',
+                      'NA' if np.isnan(ent) else f'{ent:.4f}', *row, sep='\t', file=tsv_file)
+
+def parse_args():
+    """Process input arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('fasta', metavar='F', help="Fasta alignment file")
+
+    parser.add_argument('--query', '-q', help="Name of query protein")
+    parser.add_argument('--tsv', '-t', default='', help="Also write the profile to a TSV file")
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Calculate allele frequencies for many subsets of samples in a single pass over a VCF file or
+genotype matrix (see genotype_matrix.py). A table is written for each subset in the same format
+as vcftools --freq, named after the subset file (e.g. subsets/Europe.samples -> DIR/Europe.tsv).
+Allele counts can be stored between runs, so only newly added samples need to be counted when
+the VCF is updated.
+"""
+import argparse
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from genotypes import GenotypeMatrix, open_vcf, read_vcf_header, iter_vcf_sites
+
+def read_subsets(paths):
+    """
+    Read sample subsets from files listing one sample per line, named by the file stem
+    """
+    subsets = {}
+    for path in paths:
+        with open(path, 'r') as subset_file:
+            subsets[Path(path).stem] = [i.strip() for i in subset_file if i.strip()]
+    return subsets
+
+def subset_columns(samples, subsets):
+    """
+    Convert subsets of sample names into arrays of column indices into the sample list
+    """
+    sample_index = {s: i for i, s in enumerate(samples)}
+    columns = {}
+    for name, subset in subsets.items():
+        missing = [s for s in subset if not s in sample_index]
+        if missing:
+            print(f'{len(missing)} samples from subset {name} not found',
+                  file=sys.stderr)
+        columns[name] = np.array(sorted({sample_index[s] for s in subset if s in sample_index}),
+                                 dtype=np.int64)
+    return columns
+
+def count_alleles(calls, columns, n_alleles):
+    """
+    Count the called alleles in each column subset of a site, returning an array of counts
+    for each allele per subset
+    """
+    return {name: np.bincount(calls[cols].ravel() + 1, minlength=n_alleles + 1)[1:]
+            for name, cols in columns.items()}
+
+def merge_counts(counts, alleles, previous):
+    """
+    Add counts from a previous run to new allele counts for a site
+    """
+    return counts + np.array([previous.get(a, 0) for a in alleles])
+
+def format_freqs(chrom, pos, alleles, counts):
+    """
+    Format a line of a vcftools --freq style table from allele counts
+    """
+    n_chr = counts.sum()
+    freqs = counts / n_chr if n_chr > 0 else np.full(len(alleles), np.nan)
+    return '\t'.join([chrom, pos, str(len(alleles)), str(n_chr),
+                      *[f'{a}:{f:.6g}' for a, f in zip(alleles, freqs)]])
+
+def format_counts(chrom, pos, alleles, counts):
+    """
+    Format a line of a vcftools --counts style table from allele counts
+    """
+    return '\t'.join([chrom, pos, str(len(alleles)), str(counts.sum()),
+                      *[f'{a}:{c}' for a, c in zip(alleles, counts)]])
+
+def manifest_tag(samples):
+    """
+    Tag identifying a set of counted samples, stored in the counts table so it can be checked
+    against the manifest
+    """
+    digest = hashlib.blake2b('\n'.join(sorted(samples)).encode(), digest_size=16).hexdigest()
+    return f'counted_samples={len(samples)};checksum={digest}'
+
+def read_counts_tag(path):
+    """
+    Read the manifest tag from the first line of a counts table, or None if it has none
+    """
+    with open(path, 'r') as counts_file:
+        line = counts_file.readline().rstrip('\n')
+    return line[2:] if line.startswith('##') else None
+
+def read_counts(path):
+    """
+    Read a vcftools --counts style table into a dictionary mapping (chrom, position) to
+    a dictionary of allele counts
+    """
+    counts = {}
+    with open(path, 'r') as counts_file:
+        line = next(counts_file)
+        if line.startswith('##'):
+            next(counts_file)
+        for line in counts_file:
+            line = line.rstrip('\n').split('\t')
+            counts[(line[0], line[1])] = {a: int(c) for a, c in
+                                          (i.rsplit(':', 1) for i in line[4:])}
+    return counts
+
+def read_manifest(path):
+    """
+    Read the set of samples already counted for a subset, which is empty for new subsets
+    """
+    if not os.path.isfile(path):
+        return set()
+    with open(path, 'r') as manifest_file:
+        return {i.strip() for i in manifest_file if i.strip()}
+
+def plan_counts(counts_dir, subsets, samples):
+    """
+    Determine the samples still to be counted for each subset, based on the manifests of samples
+    counted in previous runs. Subsets that have lost samples since the previous run (for example
+    date based subsets), or whose stored counts don't match their manifest (for example if a
+    run was stopped while replacing them), are recounted from scratch. Returns the samples to
+    count, previous counts and number of samples previously counted for each subset.
+    """
+    available = set(samples)
+    to_count, previous, n_counted = {}, {}, {}
+    for name, subset in subsets.items():
+        members = set(subset) & available
+        counted = read_manifest(f'{counts_dir}/{name}.counted')
+        counts_path = f'{counts_dir}/{name}.counts'
+        if counted - members or not os.path.isfile(counts_path):
+            if counted:
+                print(f'Samples removed from subset {name}, recounting', file=sys.stderr)
+            counted = set()
+        elif counted and not read_counts_tag(counts_path) == manifest_tag(counted):
+            print(f'Stored counts for subset {name} do not match its manifest, recounting',
+                  file=sys.stderr)
+            counted = set()
+
+        to_count[name] = [s for s in subset if s in members and not s in counted]
+        previous[name] = read_counts(f'{counts_dir}/{name}.counts') if counted else {}
+        n_counted[name] = len(counted)
+        print(f'Counting {len(to_count[name])} new samples for subset {name}',
+              file=sys.stderr)
+
+    return to_count, previous, n_counted
+
+def write_freqs(sites, columns, outdir, counts_dir=None, previous=None, n_counted=None,
+                all_columns=None, site_calls=None, manifests=None):
+    """
+    Count alleles from an iterator of (chrom, position, alleles, calls) tuples, writing
+    frequency tables for each column subset to outdir. If counts_dir is given, allele counts
+    are also written there to NAME.counts.tmp, after adding previous counts (see merge_counts),
+    tagged with the samples they include from manifests (see manifest_tag).
+
+    Sites without previous counts for a subset with previously counted samples are new
+    variants, so are counted over all the subset's samples (all_columns), using the calls
+    for all samples returned by site_calls(index, calls). Previously counted samples can then
+    have missing or alternate calls at these sites as well as the reference.
+    """
+    freq_files = {name: open(f'{outdir}/{name}.tsv', 'w') for name in columns}
+    count_files = {}
+    if counts_dir:
+        count_files = {name: open(f'{counts_dir}/{name}.counts.tmp', 'w') for name in columns}
+
+    try:
+        for freq_file in freq_files.values():
+            print('CHROM', 'POS', 'N_ALLELES', 'N_CHR', '{ALLELE:FREQ}',
+                  sep='\t', file=freq_file)
+
+        for name, count_file in count_files.items():
+            print(f'##{manifest_tag(manifests[name])}', file=count_file)
+            print('CHROM', 'POS', 'N_ALLELES', 'N_CHR', '{ALLELE:COUNT}',
+                  sep='\t', file=count_file)
+
+        for index, (chrom, pos, alleles, calls) in enumerate(sites):
+            counts = count_alleles(calls, columns, len(alleles))
+            full_calls = None
+            for name, freq_file in freq_files.items():
+                site_counts = counts[name]
+                if previous is not None and n_counted[name]:
+                    site_previous = previous[name].get((chrom, pos))
+                    if site_previous is not None:
+                        site_counts = merge_counts(site_counts, alleles, site_previous)
+                    else:
+                        if full_calls is None:
+                            full_calls = site_calls(index, calls)
+                        site_counts = count_alleles(full_calls, {name: all_columns[name]},
+                                                    len(alleles))[name]
+
+                print(format_freqs(chrom, pos, alleles, site_counts), file=freq_file)
+                if count_files:
+                    print(format_counts(chrom, pos, alleles, site_counts),
+                          file=count_files[name])
+
+    finally:
+        for open_file in [*freq_files.values(), *count_files.values()]:
+            open_file.close()
+
+def replace_counts(counts_dir, manifests):
+    """
+    Replace stored counts and manifests with those from this run, once all sites are processed.
+    Each manifest is replaced after its counts, and the counts are tagged with their manifest,
+    so a run stopped in between is detected by plan_counts.
+    """
+    for name, manifest in manifests.items():
+        with open(f'{counts_dir}/{name}.counted.tmp', 'w') as manifest_file:
+            for sample in manifest:
+                print(sample, file=manifest_file)
+
+    for name in manifests:
+        os.replace(f'{counts_dir}/{name}.counts.tmp', f'{counts_dir}/{name}.counts')
+        os.replace(f'{counts_dir}/{name}.counted.tmp', f'{counts_dir}/{name}.counted')
+
+def main(args):
+    """Main"""
+    for directory in (args.dir, args.counts):
+        if directory and not os.path.isdir(directory):
+            os.mkdir(directory)
+
+    subsets = read_subsets(args.subsets)
+    vcf_file = None
+    if os.path.isdir(args.vcf):
+        matrix = GenotypeMatrix(args.vcf)
+        samples = matrix.samples
+    else:
+        vcf_file = open_vcf(args.vcf)
+        _, samples = read_vcf_header(vcf_file)
+    print('Found', len(samples), 'samples and', len(subsets), 'subsets', file=sys.stderr)
+
+    previous = n_counted = all_columns = manifests = None
+    to_count = subsets
+    if args.counts:
+        to_count, previous, n_counted = plan_counts(args.counts, subsets, samples)
+        all_columns = subset_columns(samples, subsets)
+        available = set(samples)
+        manifests = {name: [s for s in dict.fromkeys(subset) if s in available]
+                     for name, subset in subsets.items()}
+    columns = subset_columns(samples, to_count)
+
+    try:
+        if vcf_file is None:
+            # Only read the required columns from the matrix
+            union = np.unique(np.concatenate([np.zeros(0, dtype=np.int64), *columns.values()]))
+            columns = {k: np.searchsorted(union, v) for k, v in columns.items()}
+            sites = matrix.iter_sites(columns=union)
+            site_calls = lambda index, _: matrix.site_calls(index)
+        else:
+            sites = iter_vcf_sites(vcf_file, len(samples))
+            site_calls = lambda _, calls: calls
+
+        write_freqs(sites, columns, args.dir, counts_dir=args.counts, previous=previous,
+                    n_counted=n_counted, all_columns=all_columns, site_calls=site_calls,
+                    manifests=manifests)
+
+    finally:
+        if vcf_file is not None:
+            vcf_file.close()
+
+    if args.counts:
+        replace_counts(args.counts, manifests)
+
+def parse_args():
+    """Process input arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('vcf', metavar='V',
+                        help="VCF file (optionally gzipped) or genotype matrix directory")
+    parser.add_argument('subsets', metavar='S', nargs='+',
+                        help="Sample subset files, listing one sample per line")
+
+    parser.add_argument('--dir', '-d', default='.',
+                        help="Directory to output frequency tables")
+    parser.add_argument('--counts', '-c', default='',
+                        help=("Directory storing allele counts and counted samples for each "
+                              "subset. Only samples not counted in previous runs are processed "
+                              "and their counts added to the stored totals"))
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -3,7 +3,8 @@
 Combine output files from batch FoldX AnalyseComplex command.
 Files must be named as FoldX names them - e.g. Interaction_NAME(_Repair)(_N)_AC.fxout where N is the
 PDB number in PDB list or is absent for the WT file. They type of file to process (interfaces,
-individual energy, interface residues or summary) is detected from the WT filename.
+individual energy, interface residues or summary) is detected from the WT filename. Any number
+of types can be combined from a single scan of the output directory by passing each WT file.
 """
 import sys
 import os
@@ -11,11 +12,15 @@ import re
 import argparse
 from dataclasses import dataclass
 from pathlib import Path
+import numpy as np
+import pandas as pd
 
-INTERFACE_RE = re.compile('^Interface_Residues_.*(_Repair)?_[0-9]*_AC.fxout$')
-INTERACTION_RE = re.compile('^Interaction_.*(_Repair)?_[0-9]*_AC.fxout$')
-INDIV_RE = re.compile('^Indiv_energies_.*(_Repair)?_[0-9]*_AC.fxout$')
-SUMMARY_RE = re.compile('^Summary_.*(_Repair)?_[0-9]*_AC.fxout$')
+FOLDX_RE = re.compile(r'^(?P<type>Interface_Residues|Interaction|Indiv_energies|Summary)_'
+                      r'.*_(?P<num>[0-9]+)_AC\.fxout$')
+FILE_TYPES = {'Interface_Residues': 'interface', 'Interaction': 'interaction',
+              'Indiv_energies': 'indiv', 'Summary': 'summary'}
+OUTPUT_NAMES = {'interface': 'interface_residues.tsv', 'interaction': 'interactions.tsv',
+                'indiv': 'individual_energies.tsv', 'summary': 'summary.tsv'}
 
 @dataclass
 class Mutation:
@@ -30,12 +35,46 @@ class Mutation:
         foldx_str = foldx_str.strip(';')
         return Mutation(foldx_str[1], int(foldx_str[2:-1]), foldx_str[0], foldx_str[-1])
 
-def combine_interaction(mutations, foldx_paths, wt_path):
+def read_last_line(path, block_size=4096):
+    """
+    Read the last line of a file by seeking back from the end, rather than reading the
+    whole file
+    """
+    with open(path, 'rb') as foldx_file:
+        size = foldx_file.seek(0, os.SEEK_END)
+        read = min(block_size, size)
+        while True:
+            foldx_file.seek(size - read)
+            lines = foldx_file.read(read).splitlines()
+            if len(lines) > 1 or read == size:
+                break
+            read = min(2 * read, size)
+    return lines[-1].decode().strip() if lines else ''
+
+def mutation_columns(mutations, foldx_files):
+    """
+    Dictionary of mutation chain, position, WT and mutant columns for numbered FoldX files
+    """
+    muts = [mutations[num - 1] for num, _ in foldx_files]
+    return {'chain': [m.chain for m in muts], 'position': [m.position for m in muts],
+            'wt': [m.wt for m in muts], 'mut': [m.mut for m in muts]}
+
+def value_columns(names, values, wt_values):
+    """
+    Dictionary of interleaved value and difference from WT columns, from a
+    (mutants x names) array of values
+    """
+    columns = {}
+    for index, name in enumerate(names):
+        columns[name] = values[:, index]
+        columns[f'diff_{name}'] = values[:, index] - wt_values[index]
+    return columns
+
+def combine_interaction(mutations, foldx_files, wt_path, output):
     """Combine Interaction files"""
-    with open(wt_path, 'r') as wt_file:
-        wt_fields = wt_file.readlines()[-1].strip().split('\t')
-    wt_floats = [float(i) for i in wt_fields[3:27]]
-    wt_ints = [int(i) for i in wt_fields[27:]]
+    wt_fields = read_last_line(wt_path).split('\t')
+    wt_floats = np.array(wt_fields[3:27], dtype=float)
+    wt_ints = np.array(wt_fields[27:], dtype=np.int64)
 
     float_cols = ['intraclashesgroup1', 'intraclashesgroup2', 'interaction_energy',
                   'backbone_hbond', 'sidechain_hbond', 'van_der_waals', 'electrostatics',
@@ -47,92 +86,69 @@ def combine_interaction(mutations, foldx_paths, wt_path):
     ]
     int_cols = ['number_of_residues', 'interface_residues', 'interface_residues_clashing',
                 'interface_residues_vdw_clashing', 'interface_residues_bb_clashing']
-    float_diff = [f'diff_{i}' for i in float_cols]
-    int_diff = [f'diff_{i}' for i in int_cols]
-
-    print('chain', 'position', 'wt', 'mut',
-          'chain1', 'chain2', *[i for p in zip(float_cols, float_diff) for i in p],
-          *[i for p in zip(int_cols, int_diff) for i in p], sep='\t')
 
-    for path in foldx_paths:
-        num = int(path.split('_')[-2])
-        mutation = mutations[num - 1]
-        with open(path, 'r') as foldx_file:
-            line = foldx_file.readlines()[-1].strip().split('\t')
-
-        chain1 = line[1]
-        chain2 = line[2]
-        line_floats = [float(i) for i in line[3:27]]
-        line_ints = [int(i) for i in line[27:]]
-        diff_floats = [mut - wt for mut, wt in zip(line_floats, wt_floats)]
-        diff_ints = [mut - wt for mut, wt in zip(line_ints, wt_ints)]
+    lines = [read_last_line(path).split('\t') for _, path in foldx_files]
+    floats = np.array([i[3:27] for i in lines], dtype=float).reshape(-1, len(wt_floats))
+    ints = np.array([i[27:] for i in lines], dtype=np.int64).reshape(-1, len(wt_ints))
 
-        print(mutation.chain, mutation.position, mutation.wt,
-              mutation.mut, chain1, chain2,
-              *[f'{v:.8f}' for p in zip(line_floats, diff_floats) for v in p],
-              *[v for p in zip(line_ints, diff_ints) for v in p], sep='\t')
+    frame = pd.DataFrame({**mutation_columns(mutations, foldx_files),
+                          'chain1': [i[1] for i in lines], 'chain2': [i[2] for i in lines],
+                          **value_columns(float_cols, floats, wt_floats),
+                          **value_columns(int_cols, ints, wt_ints)})
+    frame.to_csv(output, sep='\t', index=False, float_format='%.8f')
 
-def combine_individual_energies(mutations, foldx_paths):
+def combine_individual_energies(mutations, foldx_files, output):
     """Combine Individual Energy files"""
     print('chain', 'position', 'wt', 'mut', 'group', 'total_energy',
           'backbone_hbond', 'sidechain_hbond', 'van_der_waals', 'electrostatics',
           'solvation_polar', 'solvation_hydrophobic', 'van_der_waals_clashes',
           'entropy_sidechain', 'entropy_mainchain', 'sloop_entropy', 'mloop_entropy',
           'cis_bond', 'torsional_clash', 'backbone_clash', 'helix_dipole',
-          'water_bridge', 'disulfide', 'electrostatic_kon', 'partial_covalent_bonds', 'energy_ionisation', 'entropy_complex', sep='\t')
-    for path in foldx_paths:
-        num = int(path.split('_')[-2])
+          'water_bridge', 'disulfide', 'electrostatic_kon', 'partial_covalent_bonds',
+          'energy_ionisation', 'entropy_complex', sep='\t', file=output)
+    for num, path in foldx_files:
         mutation = mutations[num - 1]
+        prefix = [mutation.chain, str(mutation.position), mutation.wt, mutation.mut]
         with open(path, 'r') as foldx_file:
             lines = foldx_file.readlines()[9:]
+        output.writelines('\t'.join(prefix + line.strip().split('\t')[1:]) + '\n'
+                          for line in lines)
 
-        for line in lines:
-            print(mutation.chain, mutation.position, mutation.wt, mutation.mut,
-                  *line.strip().split('\t')[1:], sep='\t')
-
-def combine_interface_residues(mutations, foldx_paths, wt_path):
-    """Combine Interface Residue files"""
-    with open(wt_path, 'r') as wt_file:
-        wt_residues = set(x[1:] for x in wt_file.readlines()[-1].strip().split('\t'))
+def combine_interface_residues(mutations, foldx_files, wt_path, output):
+    """
+    Combine Interface Residue files. Lost residues are listed in the order of the WT file
+    and gained residues in the order of the mutant file.
+    """
+    wt_residues = list(dict.fromkeys(x[1:] for x in read_last_line(wt_path).split('\t')))
+    wt_set = set(wt_residues)
 
     print('chain', 'position', 'wt', 'mut', 'residues_lost',
-          'residues_gained', 'interface_residues', sep='\t')
-    for path in foldx_paths:
-        num = int(path.split('_')[-2])
+          'residues_gained', 'interface_residues', sep='\t', file=output)
+    for num, path in foldx_files:
         mutation = mutations[num - 1]
-        with open(path, 'r') as foldx_file:
-            interface_residues = foldx_file.readlines()[-1].strip().split('\t')
-        interface_set = set(x[1:] for x in interface_residues)
-        residues_lost = wt_residues - interface_set
-        residues_gained = interface_set - wt_residues
+        interface_residues = read_last_line(path).split('\t')
+        interface = list(dict.fromkeys(x[1:] for x in interface_residues))
+        interface_set = set(interface)
+        residues_lost = [i for i in wt_residues if not i in interface_set]
+        residues_gained = [i for i in interface if not i in wt_set]
         print(mutation.chain, mutation.position, mutation.wt, mutation.mut,
               ','.join(residues_lost), ','.join(residues_gained),
-              ','.join(interface_residues), sep='\t')
+              ','.join(interface_residues), sep='\t', file=output)
 
-def combine_summary(mutations, foldx_paths, wt_path):
+def combine_summary(mutations, foldx_files, wt_path, output):
     """Combine Summary files"""
-    with open(wt_path, 'r') as wt_file:
-        wt_energy = [float(i) for i in wt_file.readlines()[-1].strip().split('\t')[3:]]
-
-    print('chain', 'position', 'wt', 'mut', 'group1', 'group2',
-          'intraclashesgroup1', 'diff_intraclashesgroup1',
-          'intraclashesgroup2', 'diff_intraclashesgroup2',
-          'interaction_energy', 'diff_interaction_energy',
-          'stabilitygroup1', 'diff_stabilitygroup1',
-          'stabilitygroup2', 'diff_stabilitygroup2', sep='\t')
-    for path in foldx_paths:
-        num = int(path.split('_')[-2])
-        mutation = mutations[num - 1]
-        with open(path, 'r') as foldx_file:
-            summary = foldx_file.readlines()[-1].strip().split('\t')
-        chain1 = summary[1]
-        chain2 = summary[2]
-        summary = [float(i) for i in summary[3:]]
-        diff = [mut - wt for mut, wt in zip(summary, wt_energy)]
+    wt_fields = read_last_line(wt_path).split('\t')
+    wt_energy = np.array(wt_fields[3:], dtype=float)
 
-        print(mutation.chain, mutation.position, mutation.wt, mutation.mut,
-              chain1, chain2, *[f'{v:.8f}' for p in zip(summary, diff) for v in p],
-              sep='\t')
+    energy_cols = ['intraclashesgroup1', 'intraclashesgroup2', 'interaction_energy',
+                   'stabilitygroup1', 'stabilitygroup2']
+    lines = [read_last_line(path).split('\t') for _, path in foldx_files]
+    energy = np.array([i[3:] for i in lines], dtype=float).reshape(-1, len(wt_energy))
+
+    frame = pd.DataFrame({**mutation_columns(mutations, foldx_files),
+                          'group1': [i[1] for i in lines], 'group2': [i[2] for i in lines],
+                          **value_columns(energy_cols, energy, wt_energy)})
+    frame.to_csv(output, sep='\t', index=False, float_format='%.8f')
 
 def read_mutations(path):
     """
@@ -152,29 +168,54 @@ def detect_filetype(file):
         raise ValueError('Unknown type detected')
     return filetype
 
-def main(args):
-    """Main"""
-    filetype = detect_filetype(args.wt)
-    mutations = read_mutations(args.mutations)
-    root = args.foldx.rstrip("/")
-    files = [f for f in os.listdir(root) if f.endswith('.fxout')]
-    files = sorted(files, key=lambda x: int(x.split('_')[-2]))
-
+def find_foldx_files(root):
+    """
+    Find mutant AnalyseComplex output files in a directory in a single pass, returning a
+    dictionary mapping each file type to a list of (mutant number, path) tuples sorted by
+    mutant number
+    """
+    root = root.rstrip('/')
+    files = {i: [] for i in FILE_TYPES.values()}
+    with os.scandir(root) as entries:
+        for entry in entries:
+            match = FOLDX_RE.match(entry.name)
+            if match:
+                files[FILE_TYPES[match['type']]].append((int(match['num']),
+                                                         f'{root}/{entry.name}'))
+    return {k: sorted(v) for k, v in files.items()}
+
+def combine(filetype, mutations, foldx_files, wt_path, output):
+    """
+    Combine files of a given type, writing the table to output
+    """
     if filetype == 'interface':
-        files = [f'{root}/{f}' for f in files if INTERFACE_RE.match(f)]
-        combine_interface_residues(mutations, files, args.wt)
+        combine_interface_residues(mutations, foldx_files, wt_path, output)
 
     elif filetype == 'interaction':
-        files = [f'{root}/{f}' for f in files if INTERACTION_RE.match(f)]
-        combine_interaction(mutations, files, args.wt)
+        combine_interaction(mutations, foldx_files, wt_path, output)
 
     elif filetype == 'indiv':
-        files = [f'{root}/{f}' for f in files if INDIV_RE.match(f)]
-        combine_individual_energies(mutations, files)
+        combine_individual_energies(mutations, foldx_files, output)
 
     elif filetype == 'summary':
-        files = [f'{root}/{f}' for f in files if SUMMARY_RE.match(f)]
-        combine_summary(mutations, files, args.wt)
+        combine_summary(mutations, foldx_files, wt_path, output)
+
+def main(args):
+    """Main"""
+    filetypes = [detect_filetype(i) for i in args.wt]
+    if not args.output and len(args.wt) > 1:
+        raise ValueError('--output is required when combining more than one file type')
+
+    mutations = read_mutations(args.mutations)
+    foldx_files = find_foldx_files(args.foldx)
+
+    if not args.output:
+        combine(filetypes[0], mutations, foldx_files[filetypes[0]], args.wt[0], sys.stdout)
+        return
+
+    for filetype, wt_path in zip(filetypes, args.wt):
+        with open(f'{args.output.rstrip("/")}/{OUTPUT_NAMES[filetype]}', 'w') as output:
+            combine(filetype, mutations, foldx_files[filetype], wt_path, output)
 
 def parse_args():
     """Parse Arguments"""
@@ -182,9 +223,15 @@ def parse_args():
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     parser.add_argument('mutations', metavar='M', help="Individual list file")
-    parser.add_argument('wt', metavar='W', help="WT FoldX AC File")
+    parser.add_argument('wt', metavar='W', nargs='+',
+                        help="WT FoldX AC files, one per file type to combine")
     parser.add_argument('foldx', metavar='F', help="FoldX output directory")
 
+    parser.add_argument('--output', '-o', default='',
+                        help=("Directory to output combined tables for each file type (named "
+                              f"{', '.join(OUTPUT_NAMES.values())}), rather than outputting a "
+                              "single type to stdout"))
+
     return parser.parse_args()
 
 if __name__ == '__main__':
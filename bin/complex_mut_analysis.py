@@ -3,23 +3,136 @@
 Parralelised analysis of complex mutants usign FoldX AnalyseComplex.
 The regular FoldX method of analysing multiple mutant PDBs appears to gradually
 use more and more RAM and uses no parralelisation.
+
+Runs are resumable: each PDB's output is only moved into the output directory once FoldX
+completes successfully, and recorded in OUTPUT/checkpoints.tsv with a key identifying its input
+(a hash of the PDB). PDBs with a complete set of output files and a matching checkpoint are
+skipped, and outputs from other inputs are removed. Progress is appended to a journal
+(OUTPUT/progress.tsv) as each PDB finishes.
+
+The pipeline now uses complex_mut_pipeline.py, which imports the AnalyseComplex and checkpoint
+helpers from this module, rather than its command line interface.
 """
 import os
+import sys
+import time
+import hashlib
+import shutil
+import tempfile
 import multiprocessing
 import subprocess
-import itertools
 import argparse
+from pathlib import Path
+
+AC_FILES = ('Indiv_energies', 'Interaction', 'Interface_Residues', 'Summary')
+CHECKPOINTS = 'checkpoints.tsv'
+
+def ac_outputs(pdb):
+    """
+    Names of the AnalyseComplex output files for a PDB
+    """
+    stem = Path(pdb).stem
+    return [f'{i}_{stem}_AC.fxout' for i in AC_FILES]
+
+def is_complete(pdb, output_dir):
+    """
+    Check if all AnalyseComplex output files for a PDB exist and are non-empty
+    """
+    return all(os.path.isfile(f'{output_dir}/{i}') and os.path.getsize(f'{output_dir}/{i}') > 0
+               for i in ac_outputs(pdb))
 
-def run_analyse_complex(pdb, pdb_dir, interface, output_dir):
+def file_hash(path):
     """
-    Run FoldX AnalyseComplex command on a single PDB
+    BLAKE2b hash of a file's contents
     """
-    command = ['foldx', '--command=AnalyseComplex', f'--pdb={pdb}',
-               f'--pdb-dir={pdb_dir}', '--clean-mode=3',
-               f'--output-dir={output_dir}',
-               f'--analyseComplexChains={interface}']
-    subprocess.run(command, capture_output=True)
-    print(pdb, 'done', flush=True)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as hash_file:
+        for block in iter(lambda: hash_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_checkpoints(output_dir):
+    """
+    Read a dictionary mapping PDB names to the input keys of their completed results
+    """
+    path = f'{output_dir}/{CHECKPOINTS}'
+    if not os.path.isfile(path):
+        return {}
+
+    checkpoints = {}
+    with open(path, 'r') as checkpoint_file:
+        for line in checkpoint_file:
+            pdb, _, key = line.rstrip('\n').partition('\t')
+            if key:
+                checkpoints[pdb] = key
+    return checkpoints
+
+def record_checkpoint(output_dir, pdb, key):
+    """
+    Record that the results for a PDB are complete for the input identified by key
+    """
+    with open(f'{output_dir}/{CHECKPOINTS}', 'a') as checkpoint_file:
+        print(pdb, key, sep='\t', file=checkpoint_file, flush=True)
+
+def validate_outputs(output_dir, keys):
+    """
+    Check stored results against the current inputs, where keys maps each PDB name to a key
+    identifying its input. Results are only kept for PDBs with a complete set of outputs and
+    a checkpoint matching their key. Outputs of any other PDB, including PDBs no longer in
+    keys, are removed so they can't be combined with current results. Returns the set of PDB
+    names with valid results.
+    """
+    checkpoints = read_checkpoints(output_dir)
+    valid = {pdb for pdb, key in keys.items()
+             if checkpoints.get(pdb) == key and is_complete(pdb, output_dir)}
+
+    removed = set()
+    for name in os.listdir(output_dir):
+        for file_type in AC_FILES:
+            if name.startswith(f'{file_type}_') and name.endswith('_AC.fxout'):
+                pdb = f'{name[len(file_type) + 1:-len("_AC.fxout")]}.pdb'
+                if not pdb in valid:
+                    os.remove(f'{output_dir}/{name}')
+                    removed.add(pdb)
+                break
+
+    if removed:
+        print(f'Removed outputs for {len(removed)} PDBs not matching the current input',
+              flush=True)
+
+    tmp_path = f'{output_dir}/{CHECKPOINTS}.tmp'
+    with open(tmp_path, 'w') as checkpoint_file:
+        for pdb in sorted(valid):
+            print(pdb, keys[pdb], sep='\t', file=checkpoint_file)
+    os.replace(tmp_path, f'{output_dir}/{CHECKPOINTS}')
+
+    return valid
+
+def run_analyse_complex(pdb, pdb_dir, interface, output_dir, attempts=3):
+    """
+    Run FoldX AnalyseComplex command on a single PDB, retrying up to attempts times.
+    Output is written to a scratch directory and moved to output_dir once complete.
+    Returns the PDB, number of attempts used, time taken and error message (empty on success).
+    """
+    start = time.time()
+    error = ''
+    for attempt in range(1, attempts + 1):
+        with tempfile.TemporaryDirectory(dir=output_dir, prefix='.scratch_') as scratch:
+            command = ['foldx', '--command=AnalyseComplex', f'--pdb={pdb}',
+                       f'--pdb-dir={pdb_dir}', '--clean-mode=3',
+                       f'--output-dir={scratch}',
+                       f'--analyseComplexChains={interface}']
+            result = subprocess.run(command, capture_output=True)
+
+            if not result.returncode and is_complete(pdb, scratch):
+                for output in ac_outputs(pdb):
+                    shutil.move(f'{scratch}/{output}', f'{output_dir}/{output}')
+                return pdb, attempt, time.time() - start, ''
+
+            error = (f'exit code {result.returncode}: '
+                     f'{(result.stdout + result.stderr).decode().strip()[-500:]}')
+
+    return pdb, attempts, time.time() - start, error
 
 def main(args):
     """
@@ -28,16 +141,40 @@ def main(args):
     if not os.path.isdir(args.output):
         os.mkdir(args.output)
 
-    mutant_pdbs = [i for i in os.listdir(args.pdb) if i.endswith('.pdb')]
-    total = len(mutant_pdbs)
+    mutant_pdbs = sorted(i for i in os.listdir(args.pdb) if i.endswith('.pdb'))
+    keys = {i: file_hash(f'{args.pdb}/{i}') for i in mutant_pdbs}
+    complete = validate_outputs(args.output, keys)
+    todo = [i for i in mutant_pdbs if not i in complete]
+    total = len(todo)
+    print(f'Skipping {len(mutant_pdbs) - total} of {len(mutant_pdbs)} PDBs with complete output',
+          flush=True)
 
-    with multiprocessing.Pool(processes=args.processes) as pool:
+    failed = []
+    interface = args.interface.replace('_', ',')
+    with multiprocessing.Pool(processes=args.processes) as pool, \
+         open(f'{args.output}/progress.tsv', 'a') as journal:
         print('Opened worker pool with', pool._processes, 'workers', flush=True)
-        args = zip(mutant_pdbs,
-                   itertools.cycle([args.pdb]),
-                   itertools.cycle([args.interface.replace('_', ',')]),
-                   itertools.cycle([args.output]))
-        pool.starmap(run_analyse_complex, args)
+        jobs = [(i, args.pdb, interface, args.output, args.attempts) for i in todo]
+        for count, (pdb, attempts, seconds, error) in enumerate(
+                pool.imap_unordered(_run_analyse_complex, jobs), 1):
+            status = 'failed' if error else 'done'
+            if not error:
+                record_checkpoint(args.output, pdb, keys[pdb])
+            print(pdb, status, attempts, f'{seconds:.1f}', sep='\t', file=journal, flush=True)
+            print(f'{count}/{total}', pdb, status, f'after {attempts} attempt(s)', flush=True)
+            if error:
+                print(error, flush=True)
+                failed.append(pdb)
+
+    if failed:
+        print(f'AnalyseComplex failed on {len(failed)} PDBs:', *failed, file=sys.stderr)
+        sys.exit(1)
+
+def _run_analyse_complex(job):
+    """
+    Unpack arguments for run_analyse_complex from Pool.imap_unordered
+    """
+    return run_analyse_complex(*job)
 
 def parse_args():
     """Process arguments"""
@@ -49,6 +186,8 @@ def parse_args():
     parser.add_argument('output', metavar='O', help="Directory to output results")
     parser.add_argument('--processes', '-p', default=1, type=int,
                         help="Number of processes available")
+    parser.add_argument('--attempts', '-a', default=3, type=int,
+                        help="Maximum attempts to run FoldX on each PDB")
 
     return parser.parse_args()
 
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Build and analyse complex mutants in a streaming pipeline. Mutant PDBs are built with FoldX
+BuildModel in small batches and passed through a bounded queue to AnalyseComplex workers,
+which delete each PDB once it has been analysed. Building and analysis overlap, and only a
+limited number of mutant PDBs exist on disk at any time.
+
+Mutant PDBs are numbered by their position in the individual list (NAME_N.pdb), as in a single
+BuildModel run, so output is named the same as running BuildModel then complex_mut_analysis.py
+and can be combined with complex_combine.py. Completed mutants are checkpointed with their
+mutation and a hash of the complex PDB (see complex_mut_analysis.validate_outputs), so failed
+runs can be resumed. Results are only reused when both still match, so changes to the mutation
+list or structure are rerun.
+"""
+import os
+import sys
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+import argparse
+from pathlib import Path
+from complex_mut_analysis import (file_hash, record_checkpoint, run_analyse_complex,
+                                  validate_outputs)
+
+def read_mutations(path):
+    """
+    Read mutations from a FoldX individual list file
+    """
+    with open(path, 'r') as individual_list:
+        return [i.strip() for i in individual_list if i.strip()]
+
+def build_batch(numbers, mutations, pdb, pdb_dir, attempts=3):
+    """
+    Run FoldX BuildModel on a batch of mutations, numbered by their (1-based) position in the
+    full mutation list, in a scratch directory. Mutant PDBs are renamed by these numbers and
+    moved to pdb_dir. Returns a list of the PDB names and an error message (empty on success).
+    """
+    pdb = Path(pdb).resolve()
+    pdb_dir = Path(pdb_dir).resolve()
+    error = ''
+    for _ in range(attempts):
+        with tempfile.TemporaryDirectory(dir=pdb_dir, prefix='.build_') as scratch:
+            with open(f'{scratch}/individual_list', 'w') as individual_list:
+                print(*[mutations[i - 1] for i in numbers], sep='\n', file=individual_list)
+
+            command = ['foldx', '--command=BuildModel', f'--pdb={pdb.name}',
+                       f'--pdb-dir={pdb.parent}', f'--mutant-file={scratch}/individual_list',
+                       f'--output-dir={scratch}', '--numberOfRuns=1', '--clean-mode=3',
+                       '--out-pdb=true']
+            result = subprocess.run(command, capture_output=True, cwd=scratch)
+
+            built = [f'{scratch}/{pdb.stem}_{i}.pdb' for i in range(1, len(numbers) + 1)]
+            if not result.returncode and all(os.path.isfile(i) for i in built):
+                names = [f'{pdb.stem}_{n}.pdb' for n in numbers]
+                for path, name in zip(built, names):
+                    shutil.move(path, f'{pdb_dir}/{name}')
+                return names, ''
+
+            error = (f'exit code {result.returncode}: '
+                     f'{(result.stdout + result.stderr).decode().strip()[-500:]}')
+
+    return [], error
+
+class MutantPipeline:
+    """
+    Producer/consumer pipeline passing mutant PDBs from BuildModel to AnalyseComplex threads
+    through a bounded queue. Each thread drives a single FoldX process.
+
+    pdb:        Repaired complex PDB
+    interface:  FoldX interface chains (e.g. A_B)
+    output_dir: Directory to output AnalyseComplex results
+    pdb_dir:    Directory to temporarily store mutant PDBs
+    queue_size: Maximum built PDBs waiting for analysis
+    attempts:   Maximum attempts for each FoldX command
+    keys:       Checkpoint keys of mutant PDB names, recorded when they complete
+    """
+    def __init__(self, pdb, interface, output_dir, pdb_dir, queue_size=16, attempts=3,
+                 keys=None):
+        self.pdb = pdb
+        self.keys = keys or {}
+        self.interface = interface.replace('_', ',')
+        self.output_dir = output_dir
+        self.pdb_dir = pdb_dir
+        self.attempts = attempts
+        self.built = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue()
+        self.failed = []
+        self.count = 0
+        self.lock = threading.Lock()
+        self.journal = None
+
+    def log(self, *args, journal=None):
+        """
+        Print a progress message, and optionally a journal line, from any thread
+        """
+        with self.lock:
+            print(*args, flush=True)
+            if journal is not None:
+                print(*journal, sep='\t', file=self.journal, flush=True)
+
+    def record(self, name, total, attempts, seconds, error=''):
+        """
+        Record the outcome of a mutant in the progress count, failure list and journal
+        """
+        status = 'failed' if error else 'done'
+        with self.lock:
+            self.count += 1
+            count = self.count
+            if error:
+                self.failed.append(name)
+            elif name in self.keys:
+                record_checkpoint(self.output_dir, name, self.keys[name])
+        self.log(f'{count}/{total}', name, status, f'after {attempts} attempt(s)',
+                 *([error] if error else []),
+                 journal=(name, status, attempts, f'{seconds:.1f}'))
+
+    def builder(self, mutations, total):
+        """
+        Build batches of mutants until none remain, adding the PDBs to the analysis queue.
+        Mutants in batches that fail to build are recorded as failed.
+        """
+        while True:
+            try:
+                numbers = self.batches.get_nowait()
+            except queue.Empty:
+                return
+
+            try:
+                names, error = build_batch(numbers, mutations, self.pdb, self.pdb_dir,
+                                           self.attempts)
+            except Exception as err: # pylint: disable=broad-except
+                names, error = [], f'{type(err).__name__}: {err}'
+
+            if error:
+                self.log(f'BuildModel failed for mutations {numbers}:', error)
+                for number in numbers:
+                    self.record(f'{Path(self.pdb).stem}_{number}.pdb', total, self.attempts,
+                                0, error)
+
+            for name in names:
+                self.built.put(name)
+
+    def analyser(self, total):
+        """
+        Analyse built PDBs until receiving None, deleting each PDB afterwards. Errors are
+        recorded as failures so the queue keeps being consumed.
+        """
+        while True:
+            name = self.built.get()
+            if name is None:
+                return
+
+            attempts, seconds = 0, 0
+            try:
+                _, attempts, seconds, error = run_analyse_complex(
+                    name, self.pdb_dir, self.interface, self.output_dir, self.attempts
+                )
+            except Exception as err: # pylint: disable=broad-except
+                error = f'{type(err).__name__}: {err}'
+            finally:
+                try:
+                    os.remove(f'{self.pdb_dir}/{name}')
+                except FileNotFoundError:
+                    pass
+
+            self.record(name, total, attempts, seconds, error)
+
+    def run(self, mutations, numbers, batch_size=5, builders=1, analysers=1):
+        """
+        Build and analyse the given (1-based) mutation numbers
+        """
+        for i in range(0, len(numbers), batch_size):
+            self.batches.put(numbers[i:(i + batch_size)])
+
+        journal = open(f'{self.output_dir}/progress.tsv', 'a')
+        self.journal = journal
+        try:
+            analyser_threads = [threading.Thread(target=self.analyser, args=(len(numbers),))
+                                for _ in range(analysers)]
+            builder_threads = [threading.Thread(target=self.builder,
+                                                args=(mutations, len(numbers)))
+                               for _ in range(builders)]
+            for thread in analyser_threads + builder_threads:
+                thread.start()
+
+            for thread in builder_threads:
+                thread.join()
+            for _ in analyser_threads:
+                self.built.put(None)
+            for thread in analyser_threads:
+                thread.join()
+        finally:
+            journal.close()
+
+        return self.failed
+
+def main(args):
+    """
+    Build and analyse each mutation in the individual list
+    """
+    if not os.path.isdir(args.output):
+        os.mkdir(args.output)
+
+    mutations = read_mutations(args.mutations)
+    stem = Path(args.pdb).stem
+    pdb_hash = file_hash(args.pdb)
+    keys = {f'{stem}_{i}.pdb': f'{mutation}:{pdb_hash}'
+            for i, mutation in enumerate(mutations, 1)}
+    complete = validate_outputs(args.output, keys)
+    numbers = [i for i in range(1, len(mutations) + 1) if not f'{stem}_{i}.pdb' in complete]
+    print(f'Skipping {len(mutations) - len(numbers)} of {len(mutations)} mutations with '
+          'complete output', flush=True)
+
+    with tempfile.TemporaryDirectory(dir=args.output, prefix='.pdbs_') as pdb_dir:
+        pipeline = MutantPipeline(args.pdb, args.interface, args.output, pdb_dir,
+                                  queue_size=args.queue_size, attempts=args.attempts,
+                                  keys=keys)
+        failed = pipeline.run(mutations, numbers, batch_size=args.batch_size,
+                              builders=args.builders, analysers=args.processes)
+
+    if failed:
+        print(f'Failed to build or analyse {len(failed)} mutants:', *sorted(failed),
+              file=sys.stderr)
+        sys.exit(1)
+
+def parse_args():
+    """Process arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('pdb', metavar='P', help="Repaired complex PDB file")
+    parser.add_argument('mutations', metavar='M', help="FoldX individual list file")
+    parser.add_argument('interface', metavar='I', help="FoldX interface to process")
+    parser.add_argument('output', metavar='O', help="Directory to output results")
+
+    parser.add_argument('--processes', '-p', default=1, type=int,
+                        help="Number of AnalyseComplex processes")
+    parser.add_argument('--builders', '-b', default=1, type=int,
+                        help="Number of BuildModel processes")
+    parser.add_argument('--batch_size', '-s', default=5, type=int,
+                        help="Mutations built per BuildModel run")
+    parser.add_argument('--queue_size', '-q', default=16, type=int,
+                        help="Maximum number of built PDBs waiting for analysis")
+    parser.add_argument('--attempts', '-a', default=3, type=int,
+                        help="Maximum attempts to run each FoldX command")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
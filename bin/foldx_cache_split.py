@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Output the FoldX mutations from an individual list that don't have cached results for a
+structure (see foldx_cache.py), so only these need to be modelled
+"""
+import argparse
+import sys
+from foldx_cache import FoldXCache
+
+def main(args):
+    """Main"""
+    cache = FoldXCache(args.cache, args.pdb, version=args.version, runs=args.runs)
+    cached = cache.mutations()
+
+    n_cached = 0
+    with open(args.mutations, 'r') as individual_list:
+        for line in individual_list:
+            mutation = line.strip()
+            if not mutation:
+                continue
+            if mutation.rstrip(';') in cached:
+                n_cached += 1
+            else:
+                print(mutation)
+
+    print(f'Found {n_cached} cached mutations in {cache}', file=sys.stderr)
+
+def parse_args():
+    """Process input arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('pdb', metavar='P', help="Repaired PDB file")
+    parser.add_argument('mutations', metavar='M', help="FoldX individual list file")
+
+    parser.add_argument('--cache', '-c', required=True, help="FoldX cache directory")
+    parser.add_argument('--version', '-v', default='', help="FoldX version")
+    parser.add_argument('--runs', '-r', default=3, type=int,
+                        help="Number of FoldX runs per mutation (numberOfRuns)")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,37 +1,85 @@
 #!/usr/bin/env python3
 """
-Combine results from split parallel FoldX runs into a single table for a gene
+Combine results from split parallel FoldX runs into a single table for a gene. Results can
+also be added to and merged with a FoldX cache (see foldx_cache.py), in which case only
+uncached mutations need to be run.
 """
 import sys
 import argparse
 import pandas as pd
 from numpy import repeat, tile, arange
+from foldx_cache import FoldXCache, mutation_ids
+
+# Columns output when there are no input tables
+OUTPUT_COLUMNS = {
+    'average': ['chain', 'position', 'wt', 'mut', 'sd', 'total_energy'],
+    'dif': ['chain', 'position', 'wt', 'mut', 'total_energy'],
+    'raw': ['source', 'rep', 'chain', 'position', 'wt', 'mut', 'total_energy']
+}
 
 def main(args):
     """Main script"""
     if not len(args.foldx) == len(args.variants):
         raise ValueError('Each input table must be paired with an individual_list of variants')
 
+    data_frame = combine_foldx(args.foldx, args.variants, args.type)
+
+    if args.cache:
+        if not args.pdb or not args.mutations:
+            raise ValueError('--pdb and --mutations are required when using --cache')
+        data_frame = merge_cache(data_frame, args)
+
+    data_frame.to_csv(sys.stdout, sep='\t', index=False, float_format='%.6g')
+
+def merge_cache(data_frame, args):
+    """
+    Add new results to the cache and merge cached results for the remaining mutations,
+    ordered as in the full list of mutations
+    """
+    cache = FoldXCache(args.cache, args.pdb, version=args.version, runs=args.runs)
+    cache.update(args.type, data_frame)
+
+    with open(args.mutations, 'r') as individual_list:
+        mutations = [i.strip().rstrip(';') for i in individual_list if i.strip()]
+    order = {m: i for i, m in enumerate(mutations)}
+
+    cached = cache.read(args.type)
+    if cached is None:
+        cached = data_frame.iloc[0:0]
+    new = set(mutation_ids(data_frame))
+    cached = cached[mutation_ids(cached).isin(order.keys() - new)]
+    print(f'Merged {len(new)} new and {len(set(mutation_ids(cached)))} cached mutations',
+          file=sys.stderr)
+
+    data_frame = pd.concat([data_frame, cached])
+    index = mutation_ids(data_frame).map(order).fillna(len(order)).to_numpy()
+    data_frame = data_frame.iloc[index.argsort(kind='stable')]
+    return data_frame
+
+def combine_foldx(foldx_paths, variant_paths, fx_type):
+    """
+    Combine FoldX output tables of a given type, each paired with its individual_list
+    """
     data_frames = []
-    for df_path, variant_path in zip(args.foldx, args.variants):
+    for df_path, variant_path in zip(foldx_paths, variant_paths):
         frame = pd.read_csv(df_path, sep='\t', skiprows=8)
         frame = frame.rename(lambda x: x.lower().replace(' ', '_'), axis='columns')
 
         with open(variant_path, 'r') as variant_file:
             variants = [x.rstrip(';\n') for x in variant_file.readlines()]
 
-        if args.type == 'average':
+        if fx_type == 'average':
             frame = frame.drop('pdb', axis='columns')
             frame['variant'] = variants
             col_order = ['chain', 'position', 'wt', 'mut'] + frame.columns.tolist()[:-1]
 
-        elif args.type == 'dif':
+        elif fx_type == 'dif':
             n_reps = get_fx_reps(frame.pdb.values)
             frame = frame.drop('pdb', axis='columns')
             frame['variant'] = repeat(variants, n_reps)
             col_order = ['chain', 'position', 'wt', 'mut'] + frame.columns.tolist()[:-1]
 
-        elif args.type == 'raw':
+        elif fx_type == 'raw':
             n_reps = get_fx_reps(frame.pdb.values)
             frame = frame.drop('pdb', axis='columns')
             frame['variant'] = repeat(variants, 2*n_reps)
@@ -45,8 +93,9 @@ def main(args):
         frame = frame[col_order]
         data_frames.append(frame)
 
-    data_frame = pd.concat(data_frames)
-    data_frame.to_csv(sys.stdout, sep='\t', index=False, float_format='%.6g')
+    if not data_frames:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS[fx_type])
+    return pd.concat(data_frames)
 
 def get_fx_reps(pdb):
     """
@@ -67,13 +116,23 @@ def parse_args():
     parser = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('--foldx', '-f', nargs='+', help="Files to combine", required=True)
-    parser.add_argument('--variants', '-v', nargs='+', help="Variant lists for each input file",
-                        required=True)
+    parser.add_argument('--foldx', '-f', nargs='*', default=[], help="Files to combine")
+    parser.add_argument('--variants', '-v', nargs='*', default=[],
+                        help="Variant lists for each input file")
 
     parser.add_argument('--type', '-t', choices=['average', 'raw', 'dif'],
                         help="Type of FoldX file to process", default='average')
 
+    cache = parser.add_argument_group('Cache')
+    cache.add_argument('--cache', '-c', default='',
+                       help="FoldX cache directory to add results to and merge cached results from")
+    cache.add_argument('--pdb', '-p', default='', help="Repaired PDB file identifying the cache")
+    cache.add_argument('--mutations', '-m', default='',
+                       help="Full individual list, including cached mutations")
+    cache.add_argument('--version', default='', help="FoldX version")
+    cache.add_argument('--runs', '-r', default=3, type=int,
+                       help="Number of FoldX runs per mutation (numberOfRuns)")
+
     return parser.parse_args()
 
 if __name__ == "__main__":
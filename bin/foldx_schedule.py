@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Run FoldX BuildModel on many variants using a pool of local workers. Variants are split into
+small batches which workers pull from a shared queue, so slow batches don't hold up the rest.
+Output files are named in the same way as separate split FoldX runs, so they can be combined with
+foldx_combine.py. The time taken per mutation is estimated as the mean over its batch, since
+FoldX does not time mutations individually, and used to size batches in later runs.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+FOLDX_FILES = ('Average', 'Dif', 'Raw', 'PdbList')
+
+def read_mutations(path):
+    """
+    Read mutations from a FoldX individual list file
+    """
+    with open(path, 'r') as individual_list:
+        return [i.strip() for i in individual_list if i.strip()]
+
+def mutation_position(mutation):
+    """
+    Chain and position of a FoldX mutation string (e.g. AA12G -> A12)
+    """
+    return mutation.strip(';')[1:-1]
+
+def read_timing_table(path):
+    """
+    Read a timings table into a dictionary mapping mutations to their batch ID and time
+    """
+    if not path or not os.path.isfile(path):
+        return {}
+
+    table = {}
+    with open(path, 'r') as timings_file:
+        next(timings_file)
+        for line in timings_file:
+            mutation, batch_id, seconds = line.strip().split('\t')
+            table[mutation] = (batch_id, float(seconds))
+    return table
+
+def write_timing_table(path, table):
+    """
+    Atomically replace a timings table
+    """
+    with open(f'{path}.tmp', 'w') as timings_file:
+        print('mutation', 'batch', 'batch_mean_seconds', sep='\t', file=timings_file)
+        for mutation, (batch_id, seconds) in table.items():
+            print(mutation, batch_id, f'{seconds:.3f}', sep='\t', file=timings_file)
+    os.replace(f'{path}.tmp', path)
+
+def read_timings(table):
+    """
+    Mean time per mutation at each position from a timings table. Timings are batch averages
+    (see main), so a slow mutation also raises the estimates of the other mutations in its
+    batch.
+    """
+    times = {}
+    for mutation, (_, seconds) in table.items():
+        times.setdefault(mutation_position(mutation), []).append(seconds)
+    return {k: statistics.mean(v) for k, v in times.items()}
+
+def make_batches(mutations, timings, batch_size, target_seconds):
+    """
+    Split mutations into batches. When timings from previous runs are available, batches are
+    filled until their expected runtime reaches target_seconds, otherwise they are batch_size
+    mutations long. Batches are returned with the longest expected first, to limit stragglers
+    at the end of the run.
+    """
+    if not timings:
+        batches = [mutations[i:(i + batch_size)] for i in range(0, len(mutations), batch_size)]
+        return [(b, len(b)) for b in batches]
+
+    default = statistics.median(timings.values())
+    batches = []
+    batch = []
+    expected = 0
+    for mutation in mutations:
+        batch.append(mutation)
+        expected += timings.get(mutation_position(mutation), default)
+        if expected >= target_seconds:
+            batches.append((batch, expected))
+            batch = []
+            expected = 0
+
+    if batch:
+        batches.append((batch, expected))
+
+    return sorted(batches, key=lambda x: x[1], reverse=True)
+
+def run_build_model(batch_id, mutations, pdb, output_dir, runs):
+    """
+    Run FoldX BuildModel on a batch of mutations in a scratch directory, moving the output
+    files to output_dir once complete
+    """
+    pdb = Path(pdb).resolve()
+    output_dir = Path(output_dir).resolve()
+    with open(f'{output_dir}/individual_list_{batch_id}', 'w') as individual_list:
+        print(*mutations, sep='\n', file=individual_list)
+
+    start = time.time()
+    with tempfile.TemporaryDirectory(dir=output_dir) as scratch:
+        command = ['foldx', '--command=BuildModel', f'--pdb={pdb.name}',
+                   f'--pdb-dir={pdb.parent}',
+                   f'--mutant-file={output_dir}/individual_list_{batch_id}',
+                   f'--output-file={batch_id}', f'--output-dir={scratch}',
+                   f'--numberOfRuns={runs}', '--clean-mode=3', '--out-pdb=false']
+        result = subprocess.run(command, capture_output=True, cwd=scratch)
+
+        outputs = [f'{i}_{batch_id}_{pdb.stem}.fxout' for i in FOLDX_FILES]
+        if result.returncode or not all(os.path.isfile(f'{scratch}/{i}') for i in outputs):
+            return batch_id, mutations, None, (result.stdout + result.stderr).decode()[-2000:]
+
+        for output in outputs:
+            shutil.move(f'{scratch}/{output}', f'{output_dir}/{output}')
+
+    return batch_id, mutations, time.time() - start, ''
+
+def main(args):
+    """Main"""
+    if not os.path.isdir(args.output):
+        os.mkdir(args.output)
+
+    mutations = read_mutations(args.mutations)
+    timing_table = read_timing_table(args.timings)
+    timings = read_timings(timing_table)
+    batches = make_batches(mutations, timings, args.batch_size, args.target_seconds)
+    width = len(str(len(batches)))
+    print('Split', len(mutations), 'mutations into', len(batches), 'batches',
+          'using previous timings' if timings else '', file=sys.stderr, flush=True)
+
+    failed = []
+    with multiprocessing.Pool(processes=args.processes) as pool:
+        print('Opened worker pool with', args.processes, 'workers', file=sys.stderr, flush=True)
+        jobs = [(f'{i:0{width}}', b, args.pdb, args.output, args.runs)
+                for i, (b, _) in enumerate(batches)]
+        for batch_id, batch, seconds, error in pool.imap_unordered(_run_build_model, jobs):
+            if seconds is None:
+                print('Batch', batch_id, 'failed:', error, file=sys.stderr, flush=True)
+                failed.append(batch_id)
+                continue
+
+            print('Batch', batch_id, 'done in', f'{seconds:.1f}s', file=sys.stderr, flush=True)
+            # FoldX only reports the time for a whole batch, so record its mean per mutation
+            timing_table.update((m, (batch_id, seconds / len(batch))) for m in batch)
+
+    # Timings of mutations not run (e.g. cached or failed) are kept for later runs
+    if args.timings:
+        write_timing_table(args.timings, timing_table)
+
+    if failed:
+        raise RuntimeError(f'FoldX failed on batches: {", ".join(sorted(failed))}')
+
+def _run_build_model(job):
+    """
+    Unpack arguments for run_build_model from Pool.imap_unordered
+    """
+    return run_build_model(*job)
+
+def parse_args():
+    """Process arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('pdb', metavar='P', help="Repaired PDB file")
+    parser.add_argument('mutations', metavar='M', help="FoldX individual list file")
+    parser.add_argument('output', metavar='O', help="Directory to output results")
+
+    parser.add_argument('--processes', '-p', default=1, type=int,
+                        help="Number of processes available")
+    parser.add_argument('--runs', '-r', default=3, type=int,
+                        help="Number of FoldX runs per mutation (numberOfRuns)")
+    parser.add_argument('--batch_size', '-b', default=20, type=int,
+                        help="Mutations per batch when no previous timings are available")
+    parser.add_argument('--target_seconds', '-s', default=600, type=float,
+                        help="Target runtime per batch when previous timings are available")
+    parser.add_argument('--timings', '-t', default='',
+                        help=("Table of time taken per mutation, estimated as the mean over its "
+                              "batch. Timings from previous runs are read from here to size "
+                              "batches, then updated with this run's timings"))
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
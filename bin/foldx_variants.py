@@ -4,12 +4,11 @@ Generate list of all possible variants from a PDB file, posible filtering to
 a region of interest
 """
 import argparse
-from pathlib import Path
-from Bio.PDB import PDBParser
 from Bio.SeqUtils import seq1
 import pandas as pd
 from region import ProteinRegion
 from pdb_repair import chains_to_letters
+from structure_cache import load_structure
 
 AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
 
@@ -17,9 +16,8 @@ def main(args):
     """
     Generate list of variants from a PDB file
     """
-    pdb_path = Path(args.pdb)
-    pdb_parser = PDBParser()
-    structure = pdb_parser.get_structure(pdb_path.stem, pdb_path)
+    structure = load_structure(args.pdb, cache=args.cache)
+    structure_chains = structure.chains()
 
     if args.models:
         modeldf = pd.read_csv(args.models, sep='\t', dtype={'model': str})
@@ -29,7 +27,7 @@ def main(args):
         sections = [ProteinRegion(chain=chain, positions=positions)]
 
     else:
-        sections = [ProteinRegion(chain.id) for chain in structure[0]]
+        sections = [ProteinRegion(chain) for chain in structure_chains]
 
     # List of valid chains is used to completely skip chains with no valid residues
     chains = {s.chain for s in sections}
@@ -37,16 +35,16 @@ def main(args):
     # Transform chain IDs in the same way as when repairing PDB files (e.g. numbers to
     # letters). This means this script must be run on the untransformed PDB file in the
     # rare cases where there are
-    chain_map = chains_to_letters([c.id for c in structure[0]])
+    chain_map = chains_to_letters(structure_chains)
 
     variants = []
-    for chain in structure[0]:
+    for chain in structure_chains:
         # Short-circuit chains we don't want, if specified
-        if not chain.id in chains:
+        if not chain in chains:
             continue
 
-        mapped_chain = chain_map[chain.id]
-        for residue in chain:
+        mapped_chain = chain_map[chain]
+        for residue in structure.residues(chain=chain):
             if not sections or any(residue in s for s in sections):
                 pos = int(residue.id[1])
                 aa = seq1(residue.get_resname())
@@ -64,6 +62,8 @@ def parse_args():
                         help=("TSV file giving details of the models and regions selected "
                               "(see swissmodel_select.py)"))
     parser.add_argument('--model', '-n', type=str, help='Model number to process')
+    parser.add_argument('--cache', '-c', default='',
+                        help="Directory to cache parsed structures (see structure_cache.py)")
 
     return parser.parse_args()
 
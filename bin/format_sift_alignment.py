@@ -1,19 +1,99 @@
 """
-Convert a SIFT4G alignment into a JSON file for the frontend
+Convert a SIFT4G alignment into a JSON file for the frontend. Records are streamed, so large
+alignments are never held in memory. The alignment can also be split into tiles of sequence
+blocks and column windows, with a manifest, so viewers only need to fetch the visible tiles.
 """
+import os
 import sys
 import argparse
 import json
 from Bio import SeqIO
 
+def read_sequences(path, query=None):
+    """
+    Stream sequences from a SIFT4G alignment as dictionaries suitable for JS MSA viewers,
+    renaming the QUERY sequence and treating X as a gap
+    """
+    for record in SeqIO.parse(path, "fasta"):
+        yield {'name': query if record.id == 'QUERY' else record.id,
+               'sequence': str(record.seq).replace('X', '-')}
+
+def write_alignment(seqs, handle):
+    """
+    Write sequences to a JSON array, in the same format as json.dump(list(seqs), handle)
+    """
+    handle.write('[')
+    for i, seq in enumerate(seqs):
+        if i:
+            handle.write(', ')
+        handle.write(json.dumps(seq))
+    handle.write(']')
+
+def write_block(block, index, directory, window):
+    """
+    Write a block of sequences to column window tiles named {block}_{window}.json
+    """
+    length = len(block[0]['sequence'])
+    for start in range(0, length, window):
+        tile = [{'name': s['name'], 'sequence': s['sequence'][start:start + window]}
+                for s in block]
+        with open(f'{directory}/{index}_{start // window}.json', 'w') as tile_file:
+            json.dump(tile, tile_file)
+
+def tile_alignment(seqs, directory, manifest, block_size=500, window=500):
+    """
+    Split a stream of sequences into tiles of block_size sequences and window columns,
+    yielding each sequence as it is consumed. The manifest dictionary is updated to describe
+    the tiles once the stream is exhausted.
+    """
+    if not os.path.isdir(directory):
+        os.mkdir(directory)
+
+    block = []
+    num_seqs = num_blocks = 0
+    length = None
+    for seq in seqs:
+        if length is None:
+            length = len(seq['sequence'])
+        elif not len(seq['sequence']) == length:
+            raise ValueError(f'Sequence {seq["name"]} has length {len(seq["sequence"])}, '
+                             f'expected {length}. Is the alignment aligned?')
+
+        block.append(seq)
+        num_seqs += 1
+        yield seq
+
+        if len(block) == block_size:
+            write_block(block, num_blocks, directory, window)
+            num_blocks += 1
+            block = []
+
+    if block:
+        write_block(block, num_blocks, directory, window)
+        num_blocks += 1
+
+    length = length or 0
+    manifest.update({'sequences': num_seqs, 'length': length, 'block_size': block_size,
+                     'window': window, 'blocks': num_blocks, 'windows': -(-length // window),
+                     'tile': '{block}_{window}.json'})
+
 def main(args):
     """
     Import Fasta file and parse into a JSON suitable for JS MSA viewers
     """
-    seqs = list(SeqIO.parse(args.fasta, "fasta"))
-    seqs = [{'name': args.query if s.id == 'QUERY' else s.id,
-             'sequence': str(s.seq).replace('X', '-')} for s in seqs]
-    json.dump(seqs, sys.stdout)
+    seqs = read_sequences(args.fasta, args.query)
+    if not args.tiles:
+        write_alignment(seqs, sys.stdout)
+        return
+
+    manifest = {'query': args.query}
+    write_alignment(tile_alignment(seqs, args.tiles, manifest, args.block_size, args.window),
+                    sys.stdout)
+
+    with open(f'{args.tiles}/manifest.json', 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    print(f'Wrote {manifest["blocks"] * manifest["windows"]} tiles to {args.tiles}',
+          file=sys.stderr)
 
 def parse_args():
     """Process input arguments"""
@@ -23,6 +103,12 @@ def parse_args():
     parser.add_argument('fasta', metavar='F', help="Fasta alignment file")
 
     parser.add_argument('--query', '-q', help="Name of query protein")
+    parser.add_argument('--tiles', '-t', default='',
+                        help="Also write the alignment as tiles with a manifest to this directory")
+    parser.add_argument('--block_size', '-b', default=500, type=int,
+                        help="Number of sequences per tile")
+    parser.add_argument('--window', '-w', default=500, type=int,
+                        help="Number of alignment columns per tile")
 
     return parser.parse_args()
 
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Convert a VCF file into a compact, memory-mapped genotype matrix (see src/genotypes.py), so
+later stages can select samples by column instead of re-parsing the VCF text. Problematic
+sites can be excluded and a copy of the VCF without genotypes written in the same pass.
+"""
+import argparse
+import sys
+
+from genotypes import open_vcf, write_genotype_matrix
+
+def read_excluded_sites(path):
+    """
+    Read (chromosome, position) pairs from a sites table, as output by
+    filter_problematic_sites.py
+    """
+    with open(path, 'r') as sites_file:
+        next(sites_file)
+        return {tuple(line.strip().split('\t')[:2]) for line in sites_file if line.strip()}
+
+def main(args):
+    """Main"""
+    exclude = read_excluded_sites(args.exclude) if args.exclude else set()
+
+    sites_vcf = open(args.sites_vcf, 'w') if args.sites_vcf else None
+    try:
+        with open_vcf(args.vcf) as vcf_file:
+            n_sites = write_genotype_matrix(vcf_file, args.output, exclude=exclude,
+                                            sites_vcf=sites_vcf)
+    finally:
+        if sites_vcf is not None:
+            sites_vcf.close()
+
+    print('Wrote', n_sites, 'sites to', args.output, file=sys.stderr)
+
+def parse_args():
+    """Process input arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('vcf', metavar='V', help="VCF file (optionally gzipped)")
+    parser.add_argument('output', metavar='O', help="Output genotype matrix directory")
+
+    parser.add_argument('--exclude', '-e',
+                        help="Table of chromosome and position pairs to exclude")
+    parser.add_argument('--sites_vcf', '-s',
+                        help="Also output a VCF file with genotypes removed to this path")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Look up variants in the summary table. Variants are given in NAME:WTPOSMUT format
+(e.g. S:D614G, nsp12:P323L or N:203 for all variants at a position), and matching summary rows
+are output as a TSV with an additional query column. Alternatively, start a HTTP server that
+keeps the index loaded and returns JSON results:
+
+GET  /lookup?variant=S:D614G&variant=N:R203K
+POST /lookup with a JSON list or newline separated list of variants
+"""
+import sys
+import json
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from variant_lookup import VariantIndex
+
+def read_variants(args):
+    """
+    Collect query variants from arguments and the variants file
+    """
+    variants = list(args.variants)
+    if args.file:
+        variant_file = sys.stdin if args.file == '-' else open(args.file, 'r')
+        with variant_file:
+            variants.extend(i.strip() for i in variant_file if i.strip())
+    return variants
+
+def make_handler(index):
+    """
+    Create a request handler class serving lookups from index
+    """
+    class LookupHandler(BaseHTTPRequestHandler):
+        """
+        Serve JSON variant lookups
+        """
+        def respond(self, variants):
+            """
+            Send results for a list of variants, as a dictionary of variant: [rows]
+            """
+            results = {k: index.to_dicts(v) for k, v in index.query_many(variants)}
+            body = json.dumps(results).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self): # pylint: disable=invalid-name
+            """Handle GET requests"""
+            url = urlparse(self.path)
+            if not url.path == '/lookup':
+                self.send_error(404)
+                return
+            self.respond(parse_qs(url.query).get('variant', []))
+
+        def do_POST(self): # pylint: disable=invalid-name
+            """Handle POST requests"""
+            if not urlparse(self.path).path == '/lookup':
+                self.send_error(404)
+                return
+
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            try:
+                variants = json.loads(body)
+            except json.JSONDecodeError:
+                variants = [i.strip() for i in body.splitlines() if i.strip()]
+
+            if not isinstance(variants, list):
+                self.send_error(400, 'Expected a list of variants')
+                return
+            self.respond([str(i) for i in variants])
+
+    return LookupHandler
+
+def main(args):
+    """Main"""
+    index = VariantIndex(args.summary)
+    print(f'Loaded {len(index)} rows from {args.summary}', file=sys.stderr)
+
+    if args.serve:
+        server = ThreadingHTTPServer((args.host, args.serve), make_handler(index))
+        print(f'Serving lookups on http://{args.host}:{args.serve}/lookup', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        return
+
+    missing = 0
+    print('query', *index.columns, sep='\t')
+    for variant, rows in index.query_many(read_variants(args)):
+        if not rows:
+            missing += 1
+            print(variant, *[''] * len(index.columns), sep='\t')
+        for row in rows:
+            print(variant, *row, sep='\t')
+
+    if missing:
+        print(f'{missing} variants not found', file=sys.stderr)
+
+def parse_args():
+    """Process input arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('summary', metavar='S', help="Summary table (optionally gzipped)")
+    parser.add_argument('variants', metavar='V', nargs='*', help="Variants to look up")
+
+    parser.add_argument('--file', '-f', default='',
+                        help="File listing variants to look up, one per line ('-' for stdin)")
+    parser.add_argument('--serve', '-s', default=0, type=int,
+                        help="Serve lookups over HTTP on this port instead")
+    parser.add_argument('--host', default='127.0.0.1', help="Host address to serve on")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -6,7 +6,9 @@ import argparse
 import os
 import sys
 from dataclasses import dataclass
-from datetime import date, timedelta
+from datetime import date
+
+from genotypes import GenotypeMatrix
 
 NAME_REGIONS = {
     "Caribbean": ["Anguilla", "AntiguaandBarbuda", "Aruba", "Bahamas", "Barbados",
@@ -205,11 +207,19 @@ def get_vcf_samples(path):
                               'finding the header line, which should start with '
                               'a single #'))
 
+def get_samples(path):
+    """
+    Fetch sample names from a VCF file or genotype matrix directory
+    """
+    if os.path.isdir(path):
+        return GenotypeMatrix(path).samples
+    return get_vcf_samples(path)
+
 def main(args):
     """
     Select subsets of VCF headers
     """
-    samples = [Sample.from_string(x) for x in get_vcf_samples(args.vcf)]
+    samples = [Sample.from_string(x) for x in get_samples(args.vcf)]
 
     if args.tsv:
         with open(args.tsv, 'w') as tsv_file:
@@ -229,13 +239,7 @@ def main(args):
     subsets = {region: [] for region in NAME_REGIONS}
     subsets['overall'] = [i.string for i in samples]
 
-    # Date based periods
-    today = date.today()
-    three_month_period = timedelta(days=90)
-    six_month_period = timedelta(days=180)
-
-    subsets['last90days'] = [i.string for i in samples if (today - i.date) < three_month_period]
-    subsets['last180days'] = [i.string for i in samples if (today - i.date) < six_month_period]
+    # Date based periods are calculated by window_frequencies.py
 
     for sample in samples:
         if sample.region in NAME_REGIONS:
@@ -247,12 +251,6 @@ def main(args):
             for name, subset in subsets.items():
                 if name == 'overall':
                     desc = 'All samples'
-                elif name == 'last30days':
-                    desc = f'Samples taken in up to 30 days before {today}'
-                elif name == 'last90days':
-                    desc = f'Samples taken in up to 90 days before {today}'
-                elif name == 'last180days':
-                    desc = f'Samples taken in up to 180 days before {today}'
                 else:
                     desc = ', '.join(NAME_REGIONS[name])
                 print(name, len(subset), desc, sep='\t', file=summary_file)
@@ -269,7 +267,7 @@ def parse_args():
     parser = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('vcf', metavar='V', help="VCF file")
+    parser.add_argument('vcf', metavar='V', help="VCF file or genotype matrix directory")
 
     parser.add_argument('--tsv', '-t', default='',
                         help="Output a TSV file of samples to the specified path")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Run SIFT4G on multiple gene FASTA files in a single run, so the database is only loaded and
+prepared once. Queries are combined into one multi-FASTA file with their substitution files,
+SIFT4G is run in a scratch directory and the per query .SIFTprediction and .aligned.fasta
+outputs are moved to the output directory, named after the input FASTA files.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from Bio import SeqIO
+
+SIFT_OUTPUTS = ('SIFTprediction', 'aligned.fasta')
+
+def combine_queries(fastas, subst_dir, scratch):
+    """
+    Write all sequences from a list of FASTA files to scratch/query.fa and copy their
+    substitution files to scratch/subst, returning a dictionary mapping SIFT4G query IDs to
+    gene names (FASTA file stems)
+    """
+    os.mkdir(f'{scratch}/subst')
+    genes = {}
+    with open(f'{scratch}/query.fa', 'w') as query_file:
+        for fasta in fastas:
+            gene = Path(fasta).stem
+            records = list(SeqIO.parse(fasta, 'fasta'))
+            if not len(records) == 1:
+                raise ValueError(f'Expected one sequence in {fasta}, found {len(records)}')
+
+            query = records[0].id
+            if query in genes:
+                raise ValueError(f'Duplicate query ID {query} in {fasta}')
+            genes[query] = gene
+
+            SeqIO.write(records, query_file, 'fasta')
+            shutil.copy(f'{subst_dir}/{gene}.subst', f'{scratch}/subst/{query}.subst')
+    return genes
+
+def main(args):
+    """Main"""
+    if not os.path.isdir(args.output):
+        os.mkdir(args.output)
+
+    with tempfile.TemporaryDirectory(dir=args.output, prefix='.sift4g_') as scratch:
+        genes = combine_queries(args.fasta, args.subst, scratch)
+        print('Running SIFT4G on', len(genes), 'queries with', args.threads, 'threads',
+              file=sys.stderr, flush=True)
+
+        command = [args.sift4g, '--sub-results', '--subst', f'{scratch}/subst/',
+                   '-q', f'{scratch}/query.fa', '-d', args.db, '--out', f'{scratch}/out',
+                   '--threads', str(args.threads)]
+        start = time.time()
+        result = subprocess.run(command, stdout=sys.stderr, stderr=sys.stderr)
+        print('SIFT4G finished in', f'{time.time() - start:.1f}s', 'with exit code',
+              result.returncode, file=sys.stderr, flush=True)
+        if result.returncode:
+            raise RuntimeError(f'SIFT4G failed with exit code {result.returncode}')
+
+        missing = []
+        for query, gene in genes.items():
+            for suffix in SIFT_OUTPUTS:
+                path = f'{scratch}/out/{query}.{suffix}'
+                if os.path.isfile(path):
+                    shutil.move(path, f'{args.output}/{gene}.{suffix}')
+                else:
+                    missing.append(f'{gene}.{suffix}')
+
+    if missing:
+        raise RuntimeError(f'SIFT4G did not produce outputs: {", ".join(missing)}')
+
+def parse_args():
+    """Process arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('fasta', metavar='F', nargs='+',
+                        help="Gene FASTA files, each containing a single sequence")
+    parser.add_argument('--db', '-d', required=True, help="SIFT4G database FASTA")
+    parser.add_argument('--subst', '-s', default='data/sift',
+                        help="Directory containing GENE.subst substitution files")
+    parser.add_argument('--output', '-o', default='data/sift', help="Output directory")
+    parser.add_argument('--threads', '-t', default=8, type=int,
+                        help="Number of threads for SIFT4G to use")
+    parser.add_argument('--sift4g', default='sift4g', help="SIFT4G executable")
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    main(parse_args())
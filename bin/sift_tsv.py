@@ -1,30 +1,70 @@
 #!/usr/bin/env python3
 """
-Combine output from multiple SIFT4G runs
+Combine output from multiple SIFT4G runs. Files are parsed in parallel and written in input
+order as a TSV table, and optionally as a typed binary table with a JSON index (see
+src/sift_table.py), which summary_tsv.py can read directly.
 """
+import sys
 import argparse
+import multiprocessing
 from pathlib import Path
 
+import pandas as pd
+from sift_table import SIFT_COLUMNS, write_sift_table
+
+def parse_sift(sift_path, table=True):
+    """
+    Parse a SIFT4G prediction file, returning the TSV rows as a string and, if table is True,
+    a data frame of typed columns (otherwise None)
+    """
+    uniprot, protein = Path(sift_path).stem.split('_')
+    rows = []
+    with open(sift_path, 'r') as sift_file:
+        for line in sift_file:
+            # Skip warning header lines
+            if line[:8] == 'WARNING!':
+                continue
+
+            fields = line.strip().split('\t')
+            ref = fields[0][0]
+            alt = fields[0][-1]
+            pos = fields[0][1:-1]
+            rows.append([uniprot, protein, pos, ref, alt, *fields[1:]])
+
+    text = ''.join('\t'.join(row) + '\n' for row in rows)
+    if not table:
+        return text, None
+
+    padding = [None] * len(SIFT_COLUMNS)
+    frame = pd.DataFrame([(row + padding)[:len(SIFT_COLUMNS)] for row in rows],
+                         columns=SIFT_COLUMNS)
+    for col in ('position', 'sift_score', 'sift_median', 'num_aa', 'num_seq'):
+        frame[col] = pd.to_numeric(frame[col], errors='coerce')
+    return text, frame
+
 def main(args):
     """
     Combine output from passed SIFT4G output files
     """
-    print('uniprot', 'name', 'position', 'wt', 'mut',
-          'sift_prediction', 'sift_score', 'sift_median', 'num_aa',
-          'num_seq', sep='\t')
-    for sift_path in args.sift:
-        uniprot, protein = Path(sift_path).stem.split('_')
-        with open(sift_path, 'r') as sift_file:
-            for line in sift_file:
-                # Skip warning header lines
-                if line[:8] == 'WARNING!':
-                    continue
-
-                fields = line.strip().split('\t')
-                ref = fields[0][0]
-                alt = fields[0][-1]
-                pos = fields[0][1:-1]
-                print(uniprot, protein, pos, ref, alt, *fields[1:], sep='\t')
+    print(*SIFT_COLUMNS, sep='\t')
+    tables = []
+    with multiprocessing.Pool(processes=args.processes) as pool:
+        print('Opened worker pool with', args.processes, 'workers', file=sys.stderr, flush=True)
+        jobs = [(path, bool(args.binary)) for path in args.sift]
+        for text, table in pool.imap(_parse_sift, jobs):
+            sys.stdout.write(text)
+            if args.binary:
+                tables.append(table)
+
+    if args.binary:
+        write_sift_table(args.binary, tables)
+        print(f'Wrote binary table to {args.binary}.npy', file=sys.stderr)
+
+def _parse_sift(job):
+    """
+    Unpack arguments for parse_sift from Pool.imap
+    """
+    return parse_sift(*job)
 
 def parse_args():
     """
@@ -34,6 +74,11 @@ def parse_args():
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     parser.add_argument('sift', metavar='S', nargs='+', help="SIFT4G output files")
+    parser.add_argument('--processes', '-p', default=1, type=int,
+                        help="Number of processes available")
+    parser.add_argument('--binary', '-b', default='',
+                        help=("Also write a binary table to PREFIX.npy, with an index in "
+                              "PREFIX.json"))
 
     return parser.parse_args()
 
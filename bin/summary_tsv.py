@@ -1,100 +1,301 @@
 #!/usr/bin/env python3
 """
 Combine data from all analyses into a summary table. Input tables are those output
-by the other sections of the pipeline
+by the other sections of the pipeline. The table can also be written as a Parquet dataset
+partitioned by protein, for fast column and protein specific access (requires pyarrow), and as
+gzipped per protein shards with a JSON index, for the web frontend to load proteins separately.
+
+Tables are joined one protein at a time to limit memory usage. A first pass over each input
+table indexes the byte ranges containing each protein's rows, then each protein's rows are
+read, merged and written in turn.
 """
+import io
+import os
+import gzip
+import json
+import shutil
 from sys import stdout
 import argparse
 import pandas as pd
+from sift_table import SiftTable
 
 COVID_UNIPROT = ['P0DTD1', 'P0DTC1', 'P0DTC2', 'P0DTC3', 'P0DTC4', 'P0DTC5',
                  'P0DTC6', 'P0DTC7', 'P0DTD8', 'P0DTC8', 'P0DTC9', 'A0A663DJA2',
                  'P0DTD2', 'P0DTD3']
 
-def main(args):
+PARQUET_CATEGORIES = ['uniprot', 'name', 'wt', 'mut', 'ptm', 'template', 'int_uniprot',
+                      'int_name', 'int_template', 'annotation']
+
+SUMMARY_COLUMNS = ['uniprot', 'name', 'position', 'wt', 'mut', 'freq', 'ptm',
+                   'sift_score', 'sift_median',
+                   'template', 'relative_surface_accessibility', 'foldx_ddg',
+                   'int_uniprot', 'int_name', 'int_template', 'interaction_energy',
+                   'diff_interaction_energy', 'diff_interface_residues',
+                   'mut_escape_mean', 'mut_escape_max',
+                   'annotation']
+
+# Key column types, so tables without rows for a protein can still be merged
+KEY_TYPES = {'uniprot': str, 'name': str, 'position': 'int64', 'wt': str, 'mut': str}
+
+class TableIndex:
     """
-    Main
+    Index of the byte ranges containing each protein's rows in a delimited table with uniprot
+    and name columns, built in a single pass. Rows don't need to be sorted, but reading is
+    most efficient when each protein's rows are contiguous.
+
+    path:    Table path
+    sep:     Field separator
+    comment: Skip lines starting with this character
     """
-    ## Import tables
-    # Sift
-    sift = pd.read_csv(args.sift, sep='\t', index_col=False)
-    sift = sift[['uniprot', 'name', 'position', 'wt', 'mut', 'sift_score', 'sift_median']]
+    def __init__(self, path, sep='\t', comment=None):
+        self.path = path
+        self.sep = sep
+        self.ranges = {}
+
+        comment = comment.encode() if comment else None
+        with open(path, 'rb') as table_file:
+            self.header = table_file.readline()
+            while comment and self.header.startswith(comment):
+                self.header = table_file.readline()
+            header = self.header.rstrip(b'\r\n').decode().split(sep)
+            uniprot_col, name_col = header.index('uniprot'), header.index('name')
+            n_split = max(uniprot_col, name_col) + 1
+
+            offset = table_file.tell()
+            for line in table_file:
+                if line.strip() and not (comment and line.startswith(comment)):
+                    fields = line.decode().split(sep, n_split)
+                    key = (fields[uniprot_col], fields[name_col])
+                    ranges = self.ranges.setdefault(key, [])
+                    if ranges and ranges[-1][1] == offset:
+                        ranges[-1][1] = offset + len(line)
+                    else:
+                        ranges.append([offset, offset + len(line)])
+                offset += len(line)
+
+    def __repr__(self):
+        return f'TableIndex({self.path}, proteins={len(self.ranges)})'
+
+    def read(self, protein, usecols=None, dtype=None):
+        """
+        Read the rows for a (uniprot, name) protein into a data frame, which is empty if the
+        protein isn't in the table
+        """
+        chunks = [self.header]
+        with open(self.path, 'rb') as table_file:
+            for start, end in self.ranges.get(protein, []):
+                table_file.seek(start)
+                chunks.append(table_file.read(end - start))
+
+        dtype = {k: v for k, v in {**KEY_TYPES, **(dtype or {})}.items()
+                 if usecols is None or k in usecols}
+        return pd.read_csv(io.BytesIO(b''.join(chunks)), sep=self.sep, index_col=False,
+                           usecols=usecols, dtype=dtype)
 
-    # FoldX
-    foldx = pd.read_csv(args.foldx, sep='\t', index_col=False, dtype={'model': str})
+def prepare_sift(sift):
+    """Select SIFT4G columns"""
+    return sift[['uniprot', 'name', 'position', 'wt', 'mut', 'sift_score', 'sift_median']]
+
+def prepare_foldx(foldx):
+    """Format FoldX columns"""
     foldx['template'] = foldx['template'].str.cat(foldx['chain'], sep='.')
     foldx = foldx[['uniprot', 'name', 'position', 'mut', 'template', 'total_energy']]
-    foldx = foldx.rename(columns={'total_energy': 'foldx_ddg'})
+    return foldx.rename(columns={'total_energy': 'foldx_ddg'})
 
-    # PTMs
-    ptms = pd.read_csv(args.ptms, sep='\t', index_col=False)
-    ptms = ptms[['uniprot', 'name', 'position', 'ptm']]
+def prepare_ptms(ptms):
+    """Select PTM columns"""
+    return ptms[['uniprot', 'name', 'position', 'ptm']]
 
-    # Complex
-    complexes = pd.read_csv(args.complex, sep='\t', index_col=False)
-    complexes['int_template'] = complexes['model'].str.extract('^([0-9a-zA-Z]{4})\.[0-9]*$',
+def prepare_complex(complexes):
+    """Format complex columns"""
+    complexes['int_template'] = complexes['model'].str.extract(r'^([0-9a-zA-Z]{4})\.[0-9]*$',
                                                                expand=False)
     complexes['int_template'] = complexes['int_template'].str.cat([complexes['chain'],
                                                                    complexes['int_chain']],
                                                                   sep='.')
-    complexes = complexes[['uniprot', 'name', 'position', 'mut', 'int_uniprot',
-                           'int_name', 'int_template', 'interaction_energy',
-                           'diff_interaction_energy', 'diff_interface_residues']]
+    return complexes[['uniprot', 'name', 'position', 'mut', 'int_uniprot',
+                      'int_name', 'int_template', 'interaction_energy',
+                      'diff_interaction_energy', 'diff_interface_residues']]
 
-    # Frequency
-    frequency = pd.read_csv(args.frequency, sep='\t', index_col=False)
+def prepare_frequency(frequency):
+    """Select overall frequency"""
     frequency = frequency[['uniprot', 'name', 'position', 'wt', 'mut', 'overall']]
-    frequency = frequency.rename(columns={'overall': 'freq'})
+    return frequency.rename(columns={'overall': 'freq'})
 
-    # Surface Accessibility
-    accessibility = pd.read_csv(args.accessibility, sep='\t', index_col=False)
+def prepare_accessibility(accessibility):
+    """Select surface accessibility columns"""
     accessibility = accessibility[['uniprot', 'name', 'position', 'wt', 'all_atoms_rel']]
     sa_rename = {'all_atoms_rel': 'relative_surface_accessibility'}
-    accessibility = accessibility.rename(columns=sa_rename)
+    return accessibility.rename(columns=sa_rename)
+
+# Columns required from each indexed input table and functions to format them
+INPUT_TABLES = {
+    'sift': (['uniprot', 'name', 'position', 'wt', 'mut', 'sift_score', 'sift_median'],
+             prepare_sift),
+    'foldx': (['uniprot', 'name', 'position', 'mut', 'template', 'chain', 'total_energy'],
+              prepare_foldx),
+    'ptms': (['uniprot', 'name', 'position', 'ptm'], prepare_ptms),
+    'complex': (['uniprot', 'name', 'position', 'mut', 'model', 'chain', 'int_chain',
+                 'int_uniprot', 'int_name', 'interaction_energy', 'diff_interaction_energy',
+                 'diff_interface_residues'], prepare_complex),
+    'frequency': (['uniprot', 'name', 'position', 'wt', 'mut', 'overall'], prepare_frequency),
+    'accessibility': (['uniprot', 'name', 'position', 'wt', 'all_atoms_rel'],
+                      prepare_accessibility)
+}
 
-    # Antibody Escape Experiment
-    antibody = pd.read_csv(args.antibody, sep=',', index_col=False)
+def import_antibody(path):
+    """
+    Import antibody escape experiment data, which only covers Spike
+    """
+    antibody = pd.read_csv(path, sep=',', index_col=False)
     antibody = antibody.rename(columns={'site': 'position', 'wildtype': 'wt', 'mutation': 'mut'})
     antibody = antibody.groupby(['position', 'wt', 'mut'], as_index=False)
     antibody = antibody.agg({'mut_escape': ['mean', 'max']})
     antibody.columns = ['_'.join(i).rstrip('_') for i in antibody.columns.to_flat_index()]
     antibody['name'] = 's'
     antibody['uniprot'] = 'P0DTC2'
+    return antibody
 
-    # Annotation
+def import_annotation(path):
+    """
+    Import manual variant annotations, concatenating those for the same variant
+    """
     groups = ['uniprot', 'name', 'position', 'wt', 'mut']
-    annotation = pd.read_csv(args.annotation, sep='\t', index_col=False,
+    annotation = pd.read_csv(path, sep='\t', index_col=False,
                              comment='#', skip_blank_lines=True)
-    annotation = annotation.groupby(groups)['annotation'].apply(';'.join).reset_index()
+    return annotation.groupby(groups)['annotation'].apply(';'.join).reset_index()
 
-    ## Merge table
+def split_proteins(table):
+    """
+    Split a small table into a dictionary of (uniprot, name) protein tables
+    """
+    return {k: v for k, v in table.groupby(['uniprot', 'name'])}
+
+def merge_tables(tables):
+    """
+    Merge formatted tables for a set of proteins into the summary table
+    """
     base_cols = ['uniprot', 'name', 'position']
-    summary = sift.merge(foldx, how='outer', on=base_cols + ['mut'])
-    summary = summary.merge(ptms, how='outer', on=base_cols)
-    summary = summary.merge(complexes, how='outer', on=base_cols + ['mut'])
-    summary = summary.merge(frequency, how='outer', on=base_cols + ['wt', 'mut'])
-    summary = summary.merge(accessibility, how='outer', on=base_cols + ['wt'])
-    summary = summary.merge(antibody, how='outer', on=base_cols + ['wt', 'mut'])
-    summary = summary.merge(annotation, how='outer', on=base_cols + ['wt', 'mut'])
+    summary = tables['sift'].merge(tables['foldx'], how='outer', on=base_cols + ['mut'])
+    summary = summary.merge(tables['ptms'], how='outer', on=base_cols)
+    summary = summary.merge(tables['complex'], how='outer', on=base_cols + ['mut'])
+    summary = summary.merge(tables['frequency'], how='outer', on=base_cols + ['wt', 'mut'])
+    summary = summary.merge(tables['accessibility'], how='outer', on=base_cols + ['wt'])
+    summary = summary.merge(tables['antibody'], how='outer', on=base_cols + ['wt', 'mut'])
+    summary = summary.merge(tables['annotation'], how='outer', on=base_cols + ['wt', 'mut'])
     summary = summary.loc[summary.uniprot.isin(COVID_UNIPROT)]
     summary = summary.sort_values(by=['uniprot', 'name', 'position', 'mut'],
                                   axis='index', ignore_index=True)
     summary = summary.dropna(axis='index', subset=['wt'])
-    summary = summary[['uniprot', 'name', 'position', 'wt', 'mut', 'freq', 'ptm',
-                       'sift_score', 'sift_median',
-                       'template', 'relative_surface_accessibility', 'foldx_ddg',
-                       'int_uniprot', 'int_name', 'int_template', 'interaction_energy', 'diff_interaction_energy', 'diff_interface_residues',
-                       'mut_escape_mean', 'mut_escape_max',
-                       'annotation']]
+    return summary[SUMMARY_COLUMNS]
 
-    summary.to_csv(stdout, sep='\t', index=False, float_format='%.7g')
+def main(args):
+    """
+    Main
+    """
+    sift = SiftTable(args.sift) if args.sift.endswith('.json') else TableIndex(args.sift)
+    indices = {'sift': sift, 'foldx': TableIndex(args.foldx),
+               'ptms': TableIndex(args.ptms), 'complex': TableIndex(args.complex),
+               'frequency': TableIndex(args.frequency),
+               'accessibility': TableIndex(args.accessibility)}
+    antibody = import_antibody(args.antibody)
+    annotation = import_annotation(args.annotation)
+    empty = {'antibody': antibody.iloc[0:0], 'annotation': annotation.iloc[0:0]}
+    antibody = split_proteins(antibody)
+    annotation = split_proteins(annotation)
+
+    proteins = set(antibody.keys()) | set(annotation.keys())
+    for index in indices.values():
+        proteins.update(index.ranges.keys())
+    proteins = sorted(i for i in proteins if i[0] in COVID_UNIPROT)
+
+    for directory in (args.parquet, args.shards):
+        if directory and os.path.isdir(directory):
+            shutil.rmtree(directory)
+    if args.shards:
+        os.mkdir(args.shards)
+
+    header = '\t'.join(SUMMARY_COLUMNS) + '\n'
+    stdout.write(header)
+    offset = len(header.encode())
+    shard_index = {'columns': SUMMARY_COLUMNS, 'shards': {}}
+    for protein in proteins:
+        tables = {}
+        for name, (columns, prepare) in INPUT_TABLES.items():
+            tables[name] = prepare(indices[name].read(protein, usecols=columns,
+                                                      dtype={'model': str}))
+        tables['antibody'] = antibody.get(protein, empty['antibody'])
+        tables['annotation'] = annotation.get(protein, empty['annotation'])
+
+        summary = merge_tables(tables)
+        rows = summary.to_csv(sep='\t', index=False, float_format='%.7g', header=False)
+        stdout.write(rows)
+        if summary.empty:
+            continue
+
+        if args.parquet:
+            write_parquet(summary, args.parquet)
+
+        if args.shards:
+            shard = write_shard(summary, rows, args.shards, protein)
+            shard['tsv_offset'] = offset
+            shard_index['shards'][f'{protein[0]}_{protein[1]}'] = shard
+
+        offset += len(rows.encode())
+
+    if args.shards:
+        with open(f'{args.shards}/index.json', 'w') as index_file:
+            json.dump(shard_index, index_file, indent=1)
+
+def column_stats(summary):
+    """
+    Count of non-missing values in each column, plus the range of numeric columns
+    """
+    stats = {}
+    for col in summary.columns:
+        values = summary[col].dropna()
+        stats[col] = {'count': int(values.size)}
+        if pd.api.types.is_numeric_dtype(values) and values.size:
+            stats[col]['min'] = float(values.min())
+            stats[col]['max'] = float(values.max())
+    return stats
+
+def write_shard(summary, rows, directory, protein):
+    """
+    Write a gzipped summary table shard for a protein, returning its index entry. The
+    formatted rows are passed in so they are identical to those in summary.tsv.
+    """
+    path = f'{directory}/{protein[0]}_{protein[1]}.tsv.gz'
+    text = ('\t'.join(summary.columns) + '\n' + rows).encode()
+    compressed = gzip.compress(text, mtime=0)
+    with open(path, 'wb') as shard_file:
+        shard_file.write(compressed)
+
+    return {'file': os.path.basename(path), 'uniprot': protein[0], 'name': protein[1],
+            'rows': len(summary), 'bytes': len(compressed), 'tsv_bytes': len(rows.encode()),
+            'stats': column_stats(summary)}
+
+def write_parquet(summary, path):
+    """
+    Add a summary table to a Parquet dataset partitioned by uniprot ID and protein name.
+    String columns are stored as categories, which are dictionary encoded by Arrow.
+    """
+    try:
+        import pyarrow # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError as err:
+        raise ImportError('pyarrow is required to write Parquet output') from err
+
+    summary = summary.astype({k: 'category' for k in PARQUET_CATEGORIES})
+    summary['position'] = summary['position'].astype(int)
+    summary.to_parquet(path, engine='pyarrow', index=False, partition_cols=['uniprot', 'name'])
 
 def parse_args():
     """Process input arguments"""
     parser = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('sift', metavar='S', help="SIFT4G output table")
+    parser.add_argument('sift', metavar='S',
+                        help="SIFT4G output table, or the JSON index of its binary version")
     parser.add_argument('foldx', metavar='F', help="FoldX output table")
     parser.add_argument('ptms', metavar='P', help="PTM output table")
     parser.add_argument('complex', metavar='C', help="Complexes output table")
@@ -103,8 +304,15 @@ def parse_args():
     parser.add_argument('antibody', metavar='N', help="Antibody DMS supplementary table")
     parser.add_argument('annotation', metavar='O', help="Annotation table")
 
-    # args = parser.parse_args(["data/output/sift.tsv", "data/output/foldx.tsv", "data/output/ptms.tsv", "data/output/complex.tsv", "data/output/frequency.tsv", "data/output/surface_accessibility.tsv", "data/greaney_spike_antibody.csv", "docs/annotation.tsv"])
+    parser.add_argument('--parquet', '-p', default='',
+                        help="Also write the table as a Parquet dataset to this directory")
+    parser.add_argument('--shards', '-s', default='',
+                        help=("Also write gzipped per protein tables (UNIPROT_NAME.tsv.gz) to "
+                              "this directory, alongside index.json listing each protein's "
+                              "file, row count, compressed size, byte range in the full "
+                              "table and column statistics"))
+
     return parser.parse_args()
 
 if __name__ == '__main__':
-    main(parse_args())
\ No newline at end of file
+    main(parse_args())
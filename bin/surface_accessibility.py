@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 """
-Manage Naccess runs to calculate surface accessibility for SWISS-Model PDB downloads
+Manage Naccess runs to calculate surface accessibility for SWISS-Model PDB downloads.
+Each model is processed in its own scratch directory, so models can be run in parallel.
+Alternatively, the sasa backend calculates accessibility directly from the parsed structures
+(see src/sasa.py), without needing Naccess or writing intermediate files.
 """
 import argparse
+import multiprocessing
+import shutil
 import subprocess
+import tempfile
 import os
 import sys
 from pathlib import Path
+from types import SimpleNamespace
 
 import pandas as pd
 from Bio.PDB import PDBParser
@@ -14,6 +21,13 @@ from Bio.PDB.NACCESS import process_rsa_data
 from Bio.PDB.PDBIO import PDBIO, Select
 from Bio.SeqUtils import seq1
 
+import sasa
+
+ACCESSIBILITY_COLUMNS = ['uniprot', 'name', 'position', 'wt', 'template', 'chain',
+                         'all_atoms_abs', 'all_atoms_rel', 'side_chain_abs', 'side_chain_rel',
+                         'main_chain_abs', 'main_chain_rel', 'non_polar_abs', 'non_polar_rel',
+                         'all_polar_abs', 'all_polar_rel']
+
 def parse_model_table(path):
     """
     Parse SWISS-Model model table output by the SWISS-Model select rule, outputing
@@ -47,33 +61,71 @@ def filter_pdb(input_path, output_path, chain):
     pdbio.set_structure(structure)
     pdbio.save(output_path, select=ChainSelect(chain))
 
-def run_naccess(pdb_path):
+def run_naccess(pdb_path, cwd=None):
     """
-    Run Naccess on a PDB file
+    Run Naccess on a PDB file, with output written to the working directory cwd
     """
-    command = ['naccess', pdb_path]
-    subprocess.run(command, capture_output=True)
-
-def read_naccess_rsa(model):
+    command = ['naccess', str(pdb_path)]
+    result = subprocess.run(command, capture_output=True, cwd=cwd)
+    rsa_path = Path(cwd or '.', Path(pdb_path).with_suffix('.rsa').name)
+    if not rsa_path.is_file():
+        raise RuntimeError(f'Naccess failed on {pdb_path} (exit code {result.returncode}):\n'
+                           f'{(result.stdout + result.stderr).decode()}')
+
+def format_accessibility(df, model):
     """
-    Import a Naccess output RSA table, based on a model row imported by parse_model_table
+    Add model information to a residue accessibility table with chain, position, wt (three
+    letter code) and area columns, filtering to the model's positions
     """
-    with open(f'{model.uniprot}_{model.name}_{model.model}.rsa', 'r') as rsa_file:
-        rsa_data = process_rsa_data(rsa_file)
-    df = pd.DataFrame.from_dict(rsa_data, orient='index').reset_index()
-    df = df.rename(columns={'level_0': 'chain', 'level_1': 'position', 'res_name': 'wt'})
-    df['position'] = [i[1] for i in df['position']]
     df['uniprot'] = model.uniprot
     df['name'] = model.name
     df['template'] = model.template
     df['wt'] = [seq1(i) for i in df['wt']]
     positions = [int(i) for i in model.positions.split(',')]
     df = df[df['position'].isin(positions)]
-    df = df[['uniprot', 'name', 'position', 'wt', 'template', 'chain', 'all_atoms_abs',
-            'all_atoms_rel', 'side_chain_abs', 'side_chain_rel', 'main_chain_abs',
-            'main_chain_rel', 'non_polar_abs', 'non_polar_rel', 'all_polar_abs',
-            'all_polar_rel']]
-    return df
+    return df[ACCESSIBILITY_COLUMNS]
+
+def read_naccess_rsa(model, directory='.'):
+    """
+    Import a Naccess output RSA table, based on a model row imported by parse_model_table
+    """
+    with open(f'{directory}/{model.uniprot}_{model.name}_{model.model}.rsa', 'r') as rsa_file:
+        rsa_data = process_rsa_data(rsa_file)
+    df = pd.DataFrame.from_dict(rsa_data, orient='index').reset_index()
+    df = df.rename(columns={'level_0': 'chain', 'level_1': 'position', 'res_name': 'wt'})
+    df['position'] = [i[1] for i in df['position']]
+    return format_accessibility(df, model)
+
+def process_model(model, directory, backend='naccess', cache=None):
+    """
+    Calculate accessibility for the chain of interest in a model. The naccess backend filters
+    the model PDB to the chain, runs Naccess in a scratch directory and imports the results,
+    moving Naccess output files to directory. The sasa backend calculates it directly, using
+    parsed structures from the structure cache directory cache if given.
+    """
+    model = SimpleNamespace(**model)
+    stem = f'{model.uniprot}_{model.name}_{model.model}'
+    path = f'data/swissmodel/{model.uniprot}_{model.name}/{model.model}/model.pdb'
+    if backend == 'sasa':
+        df = sasa.pdb_accessibility(path, chain=model.chain, cache=cache)
+        print('Processed', path, file=sys.stderr, flush=True)
+        return format_accessibility(df, model)
+
+    with tempfile.TemporaryDirectory(dir=directory, prefix=f'.{stem}_') as scratch:
+        filter_pdb(path, f'{scratch}/{stem}.pdb', model.chain)
+        run_naccess(f'{stem}.pdb', cwd=scratch)
+        for output in os.listdir(scratch):
+            if output.startswith(stem):
+                shutil.move(f'{scratch}/{output}', f'{directory}/{output}')
+
+    print('Processed', path, file=sys.stderr, flush=True)
+    return read_naccess_rsa(model, directory)
+
+def _process_model(job):
+    """
+    Unpack arguments for process_model from Pool.imap
+    """
+    return process_model(*job)
 
 def main(args):
     """Import model tables, filter PDB files, pass them to Naccess and generate an overall tsv"""
@@ -86,21 +138,11 @@ def main(args):
     models = pd.concat([parse_model_table(i) for i in args.models], axis=0).reset_index(drop=True)
     print('done', file=sys.stderr)
 
-    # Filter PDB for Naccess
-    for model in models.itertuples():
-        path = f'data/swissmodel/{model.uniprot}_{model.name}/{model.model}/model.pdb'
-        print('Filtering ', path, '...', sep='', end=' ', file=sys.stderr)
-        filter_pdb(path, f'{args.dir}/{model.uniprot}_{model.name}_{model.model}.pdb', model.chain)
-        print('done', file=sys.stderr)
-
-    # Run Naccess and load results
-    os.chdir(args.dir)
-    accessibility = []
-    for model in models.itertuples():
-        path = f'{model.uniprot}_{model.name}_{model.model}.pdb'
-        print('Running Naccess on', path, file=sys.stderr)
-        run_naccess(path)
-        accessibility.append(read_naccess_rsa(model))
+    # Calculate accessibility for each model
+    jobs = [(model, args.dir, args.backend, args.cache) for model in models.to_dict('records')]
+    with multiprocessing.Pool(processes=args.processes) as pool:
+        print('Opened worker pool with', args.processes, 'workers', file=sys.stderr, flush=True)
+        accessibility = list(pool.imap(_process_model, jobs))
 
     tsv = pd.concat(accessibility, axis=0).reset_index(drop=True)
     tsv.to_csv(sys.stdout, sep='\t', index=False, float_format='%.7g')
@@ -112,7 +154,14 @@ def parse_args():
 
     parser.add_argument('models', metavar='M', nargs='+',
                         help="Model tables generated from SWISS-Model download")
-    parser.add_argument('--dir', '-d', help="Directory to store Naccess outputs")
+    parser.add_argument('--dir', '-d', default='.', help="Directory to store Naccess outputs")
+    parser.add_argument('--processes', '-p', default=1, type=int,
+                        help="Number of processes available")
+    parser.add_argument('--backend', '-b', default='naccess', choices=['naccess', 'sasa'],
+                        help="Calculate accessibility using Naccess or the built in "
+                             "Shrake-Rupley implementation")
+    parser.add_argument('--cache', '-c', default='',
+                        help="Directory to cache parsed structures, used by the sasa backend")
 
     # args = parser.parse_args(["-d", "data/naccess", "data/swissmodel/P0DTC2_s.models", "data/swissmodel/P0DTC3_orf3a.models", "data/swissmodel/P0DTC4_e.models", "data/swissmodel/P0DTC5_m.models", "data/swissmodel/P0DTC6_orf6.models", "data/swissmodel/P0DTC7_orf7a.models", "data/swissmodel/P0DTC8_orf8.models", "data/swissmodel/P0DTC9_nc.models", "data/swissmodel/P0DTD1_nsp1.models", "data/swissmodel/P0DTD1_nsp10.models", "data/swissmodel/P0DTD1_nsp12.models", "data/swissmodel/P0DTD1_nsp13.models", "data/swissmodel/P0DTD1_nsp14.models", "data/swissmodel/P0DTD1_nsp15.models", "data/swissmodel/P0DTD1_nsp16.models", "data/swissmodel/P0DTD1_nsp2.models", "data/swissmodel/P0DTD1_nsp3.models", "data/swissmodel/P0DTD1_nsp4.models", "data/swissmodel/P0DTD1_nsp5.models", "data/swissmodel/P0DTD1_nsp6.models", "data/swissmodel/P0DTD1_nsp7.models", "data/swissmodel/P0DTD1_nsp8.models", "data/swissmodel/P0DTD1_nsp9.models", "data/swissmodel/P0DTD2_orf9b.models"])
     return parser.parse_args()
@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 """
-Select the best set of models for a gene
+Select the best set of models for a gene. Models are prioritised by type (direct models of the
+protein before homology models) and then QMEAN Z-score, with each position assigned to the
+highest priority selected model covering it. Two selection methods are available:
+
+greedy: Select every model that covers at least one new position
+cover:  Select the set of models maximising the number of covered positions weighted by
+        QMEAN (qmean6 normalised score), minus a cost for each model and for each contiguous
+        fragment assigned to a model. Higher costs give fewer, larger models.
 """
 import argparse
 import json
 import re
 import os
+import sys
 from pathlib import Path
 from dataclasses import dataclass
 from region import ProteinRegion
@@ -47,6 +55,60 @@ class Model:
                      report['QMean']['global_scores']['qmean6_z_score'],
                      info['creation_date'])
 
+def assign_positions(models):
+    """
+    Assign positions to a list of models in priority order, returning a list of (model, region)
+    tuples for models that are assigned at least one position
+    """
+    assigned = []
+    covered_region = ProteinRegion('', '')
+    for model in models:
+        new_region = model.region.difference(covered_region)
+        if new_region:
+            assigned.append((model, new_region))
+            covered_region = covered_region.union(new_region)
+    return assigned
+
+def selection_score(assigned, model_cost=0, fragment_cost=0):
+    """
+    Score a list of (model, region) assignments from assign_positions, as the QMEAN weighted
+    number of positions covered minus model and fragment costs
+    """
+    return sum(len(region) * model.qmean6 - model_cost - fragment_cost * len(region.intervals)
+               for model, region in assigned)
+
+def select_cover(models, model_cost=0, fragment_cost=0):
+    """
+    Select models from a priority ordered list, approximately maximising selection_score.
+    Models are greedily added by largest score gain, then selected models are pruned
+    while removing one improves the score.
+    """
+    priority = {id(m): i for i, m in enumerate(models)}
+    def score(selection):
+        selection = sorted(selection, key=lambda m: priority[id(m)])
+        return selection_score(assign_positions(selection), model_cost, fragment_cost)
+
+    selected = []
+    current = 0
+    remaining = list(models)
+    while remaining:
+        scores = [score(selected + [m]) for m in remaining]
+        best = max(range(len(remaining)), key=lambda i: scores[i])
+        if scores[best] <= current:
+            break
+        current = scores[best]
+        selected.append(remaining.pop(best))
+
+    while selected:
+        scores = [score(selected[:i] + selected[i + 1:]) for i in range(len(selected))]
+        best = max(range(len(selected)), key=lambda i: scores[i])
+        if scores[best] <= current:
+            break
+        current = scores[best]
+        selected.pop(best)
+
+    return assign_positions(sorted(selected, key=lambda m: priority[id(m)]))
+
 def main(args):
     """
     Main
@@ -66,21 +128,21 @@ def main(args):
     homology_models = [m for m in models if m.seq_id < 100]
     models = direct_models + homology_models
 
-    selected_models = []
-    if models:
-        selected_models.append((models[0], set(models[0].region.positions)))
-        for model in models[1:]:
-            covered_region = set().union(*[m[1] for m in selected_models])
-            new_region = set(model.region.positions) - covered_region
-            if new_region:
-                selected_models.append((model, new_region))
+    if args.method == 'cover':
+        selected_models = select_cover(models, args.model_cost, args.fragment_cost)
+    else:
+        selected_models = assign_positions(models)
+
+    print(f'Selected {len(selected_models)} of {len(models)} models, covering',
+          sum(len(r) for _, r in selected_models), 'positions in',
+          sum(len(r.intervals) for _, r in selected_models), 'fragments', file=sys.stderr)
 
     print('model', 'template', 'chain', 'offset', 'seq_id', 'coverage',
           'qmean6_z', 'date', 'positions', sep='\t')
     for model, region in selected_models:
         print(model.number, model.template, model.chain, model.offset, model.seq_id,
               model.coverage, model.qmean6_z, model.date,
-              ','.join(str(r) for r in region), sep='\t')
+              ','.join(str(r) for r in region.positions), sep='\t')
 
 def parse_args():
     """Process input arguments"""
@@ -94,6 +156,14 @@ def parse_args():
     select.add_argument('--seq_id', '-s', default=0, type=float, help="Minimum sequence identify")
     select.add_argument('--coverage', '-c', default=0, type=float, help="Minimum coverage")
     select.add_argument('--qmean_z', '-q', default=-4, type=float, help="Minimum QMEAN Z-score")
+    select.add_argument('--method', '-m', default='greedy', choices=['greedy', 'cover'],
+                        help="Model selection method")
+    select.add_argument('--model_cost', default=20, type=float,
+                        help=("Cost of selecting each model, in QMEAN weighted positions "
+                              "(cover method)"))
+    select.add_argument('--fragment_cost', default=5, type=float,
+                        help=("Cost of each contiguous fragment assigned to a model, in QMEAN "
+                              "weighted positions (cover method)"))
 
     return parser.parse_args()
 
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Calculate allele frequencies over time windows in a single pass over a VCF file or genotype
+matrix. Sample dates are binned into daily, weekly or monthly buckets once, then allele counts
+for any window are taken from prefix sums of the per bucket counts at each site. A vcftools
+--freq style table is written for each window.
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+from genotypes import GenotypeMatrix, open_vcf, read_vcf_header, iter_vcf_sites
+from sample_subsets import Sample
+from allele_frequencies import format_freqs
+
+def bucket_ordinal(day, bucket):
+    """
+    Integer identifying the day, week (starting Monday) or month containing a date
+    """
+    if bucket == 'week':
+        return (day.toordinal() - 1) // 7
+    if bucket == 'month':
+        return 12 * day.year + day.month - 1
+    return day.toordinal()
+
+def ordinal_date(ordinal, bucket):
+    """
+    First date of a bucket from its ordinal
+    """
+    if bucket == 'week':
+        return date.fromordinal(7 * ordinal + 1)
+    if bucket == 'month':
+        return date(ordinal // 12, ordinal % 12 + 1, 1)
+    return date.fromordinal(ordinal)
+
+class TimeBuckets:
+    """
+    Assignment of samples to time buckets, which converts date windows into bucket index
+    ranges. Windows are rounded outwards to whole buckets.
+
+    samples: Sample name strings, parsed with Sample.from_string
+    bucket:  Bucket size - 'day', 'week' or 'month'
+    """
+    def __init__(self, samples, bucket='day'):
+        self.bucket = bucket
+        ordinals = [bucket_ordinal(Sample.from_string(s).date, bucket) for s in samples]
+        ordinals = np.array(ordinals, dtype=np.int64)
+        self.first = ordinals.min() if ordinals.size else 0
+        self.sample_buckets = ordinals - self.first
+        self.n_buckets = int(self.sample_buckets.max()) + 1 if ordinals.size else 0
+        self.samples_per_bucket = np.bincount(self.sample_buckets, minlength=self.n_buckets)
+
+    def index(self, day):
+        """
+        Index of the bucket containing day, relative to the first observed bucket
+        """
+        return bucket_ordinal(day, self.bucket) - self.first
+
+    def window(self, start=None, end=None):
+        """
+        Bucket index range [start, end) covering dates from start up to but excluding end,
+        clipped to the observed buckets. None means the window is unbounded on that side.
+        """
+        start = 0 if start is None else self.index(start)
+        end = self.n_buckets if end is None else self.index(end - timedelta(days=1)) + 1
+        start = int(np.clip(start, 0, self.n_buckets))
+        end = int(np.clip(end, start, self.n_buckets))
+        return start, end
+
+    def start_date(self, index):
+        """
+        First date of the bucket at index
+        """
+        return ordinal_date(self.first + index, self.bucket)
+
+    def count_samples(self, window):
+        """
+        Number of samples in a window
+        """
+        return int(self.samples_per_bucket[window[0]:window[1]].sum())
+
+def bucket_prefix_counts(calls, sample_buckets, n_buckets, n_alleles):
+    """
+    Cumulative allele counts over time buckets for a site, as an (n_buckets + 1, n_alleles)
+    array starting with a row of zeros so window counts are prefix[end] - prefix[start]
+    """
+    buckets = np.repeat(sample_buckets, calls.shape[1])
+    calls = calls.ravel()
+    called = calls >= 0
+    counts = np.bincount(buckets[called] * n_alleles + calls[called],
+                         minlength=n_buckets * n_alleles).reshape(n_buckets, n_alleles)
+    prefix = np.zeros((n_buckets + 1, n_alleles), dtype=np.int64)
+    np.cumsum(counts, axis=0, out=prefix[1:])
+    return prefix
+
+def parse_windows(args, buckets, today):
+    """
+    Determine windows from arguments, returning a dictionary of name: (start, end) bucket
+    index ranges and a dictionary of window descriptions
+    """
+    windows = {}
+    desc = {}
+    for days in args.last:
+        name = f'last{days}days'
+        windows[name] = buckets.window(start=today - timedelta(days=days - 1))
+        desc[name] = f'Samples taken in up to {days} days before {today}'
+
+    for window in args.window:
+        name, start, end = window.split(':')
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+        windows[name] = buckets.window(start=start, end=end)
+        desc[name] = f"Samples taken from {start or 'the start'} until {end or 'the end'}"
+
+    if args.rolling:
+        width, step = args.rolling
+        end = buckets.index(today) + 1
+        while end - width >= 0:
+            start = end - width
+            if start < buckets.n_buckets:
+                name = f'rolling_{buckets.start_date(start)}'
+                windows[name] = (start, min(end, buckets.n_buckets))
+                desc[name] = (f'Samples taken in the {width} {buckets.bucket}(s) from '
+                              f'{buckets.start_date(start)}')
+            end -= step
+
+    return windows, desc
+
+def write_window_freqs(sites, buckets, windows, outdir):
+    """
+    Write frequency tables for each window from an iterator of (chrom, position, alleles, calls)
+    tuples
+    """
+    starts = np.array([w[0] for w in windows.values()], dtype=np.int64)
+    ends = np.array([w[1] for w in windows.values()], dtype=np.int64)
+    freq_files = [open(f'{outdir}/{name}.tsv', 'w') for name in windows]
+    try:
+        for freq_file in freq_files:
+            print('CHROM', 'POS', 'N_ALLELES', 'N_CHR', '{ALLELE:FREQ}',
+                  sep='\t', file=freq_file)
+
+        for chrom, pos, alleles, calls in sites:
+            prefix = bucket_prefix_counts(calls, buckets.sample_buckets, buckets.n_buckets,
+                                          len(alleles))
+            counts = prefix[ends] - prefix[starts]
+            for freq_file, window_counts in zip(freq_files, counts):
+                print(format_freqs(chrom, pos, alleles, window_counts), file=freq_file)
+
+    finally:
+        for freq_file in freq_files:
+            freq_file.close()
+
+def main(args):
+    """Main"""
+    if not os.path.isdir(args.dir):
+        os.mkdir(args.dir)
+
+    vcf_file = None
+    if os.path.isdir(args.vcf):
+        matrix = GenotypeMatrix(args.vcf)
+        samples = matrix.samples
+    else:
+        vcf_file = open_vcf(args.vcf)
+        _, samples = read_vcf_header(vcf_file)
+
+    today = date.fromisoformat(args.date) if args.date else date.today()
+    buckets = TimeBuckets(samples, bucket=args.bucket)
+    windows, desc = parse_windows(args, buckets, today)
+    print('Found', len(samples), 'samples in', buckets.n_buckets, 'buckets, calculating',
+          len(windows), 'windows', file=sys.stderr)
+
+    try:
+        if vcf_file is None:
+            sites = matrix.iter_sites()
+        else:
+            sites = iter_vcf_sites(vcf_file, len(samples))
+        write_window_freqs(sites, buckets, windows, args.dir)
+
+    finally:
+        if vcf_file is not None:
+            vcf_file.close()
+
+    if args.summary:
+        with open(args.summary, 'w') as summary_file:
+            print('name', 'n', 'desc', sep='\t', file=summary_file)
+            for name, window in windows.items():
+                print(name, buckets.count_samples(window), desc[name],
+                      sep='\t', file=summary_file)
+
+def parse_args():
+    """Process input arguments"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('vcf', metavar='V',
+                        help="VCF file (optionally gzipped) or genotype matrix directory")
+
+    parser.add_argument('--dir', '-d', default='.',
+                        help="Directory to output frequency tables")
+    parser.add_argument('--summary', '-s', default='',
+                        help="Output a summary table of the windows")
+
+    windows = parser.add_argument_group('Windows')
+    windows.add_argument('--bucket', '-b', default='day', choices=('day', 'week', 'month'),
+                         help="Size of time buckets. Windows are rounded to whole buckets")
+    windows.add_argument('--date', '-t', default='',
+                         help="Reference date (YYYY-MM-DD) for relative windows, defaults to today")
+    windows.add_argument('--last', '-l', nargs='+', type=int, default=[],
+                         help="Windows covering samples from the last N days, named lastNdays")
+    windows.add_argument('--window', '-w', nargs='+', default=[],
+                         help=("Arbitrary windows in NAME:START:END format, covering dates from "
+                               "START (YYYY-MM-DD) up to END. START or END can be empty for "
+                               "unbounded windows"))
+    windows.add_argument('--rolling', '-r', nargs=2, type=int, metavar=('WIDTH', 'STEP'),
+                         help=("Rolling windows of WIDTH buckets, every STEP buckets back from "
+                               "the reference date, named rolling_START"))
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -103,32 +103,6 @@ rule complex_variants:
         regex = f"--regex '^[A-Z][{allowed_chains}][0-9]*$' "
         shell(f"tail -n +10 {input.residues} | grep -v interface | tr '\n' '\t' | xargs python bin/protein_variants.py --unique --suffix $';\n' --exclude --wt 0 --foldx --sort 2 {regex}> {output} 2> {log}")
 
-rule complex_mutant_models:
-    """
-    Generate PDBs with each mutation in the interface using FoldX BuildModel
-    """
-    input:
-        muts='data/complex/{complex}/{interface}/individual_list',
-        pdb='data/complex/{complex}/model_Repair.pdb'
-
-    output:
-        directory('data/complex/{complex}/{interface}/mutant_pdbs'),
-        'data/complex/{complex}/{interface}/mutant_models_made'
-
-    resources:
-        mem_mb = 16000
-
-    log:
-        'logs/complex_mutant_models/{complex}_{interface}.log'
-
-    shell:
-        """
-        mkdir data/complex/{wildcards.complex}/{wildcards.interface}/mutant_pdbs &> {log}
-        foldx --command=BuildModel --pdb-dir=data/complex/{wildcards.complex} --pdb=model_Repair.pdb --mutant-file={input.muts} --output-dir=data/complex/{wildcards.complex}/{wildcards.interface}/mutant_pdbs --numberOfRuns=1 --clean-mode=3 --out-pdb=true &> {log}
-        rm data/complex/{wildcards.complex}/{wildcards.interface}/mutant_pdbs/WT_* &> {log}
-        touch 'data/complex/{wildcards.complex}/{wildcards.interface}/mutant_models_made' &> {log}
-        """
-
 def get_mut_complex_ram(wildcards):
     """
     Get RAM to use for each complex
@@ -138,15 +112,24 @@ def get_mut_complex_ram(wildcards):
 
 rule complex_mut_analysis:
     """
-    Analyse mutant interfaces using FoldX AnalyseComplex.
+    Build mutant complexes with FoldX BuildModel and analyse their interfaces with
+    AnalyseComplex, streaming small batches of mutant PDBs between the two so not all mutant
+    PDBs are stored at once. Only the flag file is declared as output, so Snakemake doesn't
+    delete completed results in the mutant directory if the job fails, and a rerun resumes
+    from where it stopped. Results are checkpointed with their mutation and a hash of the
+    PDB, so only those matching the current inputs are reused.
     """
     input:
-        'data/complex/{complex}/{interface}/mutant_models_made'
+        muts='data/complex/{complex}/{interface}/individual_list',
+        pdb='data/complex/{complex}/model_Repair.pdb'
 
     output:
-        directory('data/complex/{complex}/{interface}/mutant'),
         'data/complex/{complex}/{interface}/mutant_analysis_done'
 
+    params:
+        # Two threads drive BuildModel, the rest AnalyseComplex
+        analysers = lambda wildcards, threads: max(threads - 2, 1)
+
     resources:
         mem_mb = get_mut_complex_ram,
 
@@ -157,7 +140,7 @@ rule complex_mut_analysis:
 
     shell:
         """
-        python bin/complex_mut_analysis.py --processes 8 data/complex/{wildcards.complex}/{wildcards.interface}/mutant_pdbs {wildcards.interface} data/complex/{wildcards.complex}/{wildcards.interface}/mutant &> {log}
+        python bin/complex_mut_pipeline.py --processes {params.analysers} --builders 2 {input.pdb} {input.muts} {wildcards.interface} data/complex/{wildcards.complex}/{wildcards.interface}/mutant &> {log}
         touch data/complex/{wildcards.complex}/{wildcards.interface}/mutant_analysis_done &> {log}
         """
 
@@ -182,11 +165,8 @@ rule complex_combine:
     log:
         'logs/complex_combine/{complex}_{interface}.log'
 
-    run:
-        shell(f"python bin/complex_combine.py {input.mutants} {input.wt_indiv} data/complex/{wildcards.complex}/{wildcards.interface}/mutant > {output.indiv} 2> {log}")
-        shell(f"python bin/complex_combine.py {input.mutants} {input.wt_interaction} data/complex/{wildcards.complex}/{wildcards.interface}/mutant > {output.interaction} 2> {log}")
-        shell(f"python bin/complex_combine.py {input.mutants} {input.wt_interface} data/complex/{wildcards.complex}/{wildcards.interface}/mutant > {output.interface} 2> {log}")
-        shell(f"python bin/complex_combine.py {input.mutants} {input.wt_summary} data/complex/{wildcards.complex}/{wildcards.interface}/mutant > {output.summary} 2> {log}")
+    shell:
+        "python bin/complex_combine.py --output data/complex/{wildcards.complex}/{wildcards.interface} {input.mutants} {input.wt_indiv} {input.wt_interaction} {input.wt_interface} {input.wt_summary} data/complex/{wildcards.complex}/{wildcards.interface}/mutant &> {log}"
 
 def get_complex_tsv_files(complex):
     """
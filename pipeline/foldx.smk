@@ -1,6 +1,10 @@
 """
 Rules for generating FoldX ddG predictions
 """
+FOLDX_DIR = 'scheduled' if config['foldx'].get('scheduler', 'cluster') == 'local' else 'processing'
+FOLDX_RUNS = config['foldx'].get('runs', 3)
+FOLDX_CACHE = config['foldx'].get('cache', '')
+FOLDX_LIST = 'uncached_list' if FOLDX_CACHE else 'individual_list'
 
 rule foldx_repair:
     """
@@ -38,18 +42,43 @@ rule foldx_variants:
     output:
         muts="data/foldx/{gene}_{model}/individual_list"
 
+    params:
+        cache=config['general'].get('structure_cache', '')
+
     log:
         "logs/foldx_variants/{gene}_{model}.log"
 
     shell:
-        "python bin/foldx_variants.py --model {wildcards.model} --models {input.models} {input.pdb} > {output.muts} 2> {log}"
+        "python bin/foldx_variants.py --cache '{params.cache}' --model {wildcards.model} --models {input.models} {input.pdb} > {output.muts} 2> {log}"
+
+rule foldx_cache_split:
+    """
+    Identify variants without cached FoldX results, which still need to be modelled
+    """
+    input:
+        pdb="data/foldx/{structure}/model_Repair.pdb",
+        muts="data/foldx/{structure}/individual_list"
+
+    output:
+        "data/foldx/{structure}/uncached_list"
+
+    params:
+        cache = FOLDX_CACHE,
+        version = config['foldx'].get('version', ''),
+        runs = FOLDX_RUNS
+
+    log:
+        "logs/foldx_cache_split/{structure}.log"
+
+    shell:
+        "python bin/foldx_cache_split.py --cache {params.cache} --version '{params.version}' --runs {params.runs} {input.pdb} {input.muts} > {output} 2> {log}"
 
 checkpoint foldx_split:
     """
     Split variants lists into subsections to parralelise FoldX
     """
     input:
-        "data/foldx/{structure}/individual_list"
+        f"data/foldx/{{structure}}/{FOLDX_LIST}"
 
     output:
         directory("data/foldx/{structure}/processing")
@@ -63,7 +92,7 @@ checkpoint foldx_split:
     shell:
         """
         mkdir data/foldx/{wildcards.structure}/processing &> {log}
-        split -l {params.n_lines} data/foldx/{wildcards.structure}/individual_list data/foldx/{wildcards.structure}/processing/individual_list_ &> {log}
+        split -l {params.n_lines} {input} data/foldx/{wildcards.structure}/processing/individual_list_ &> {log}
         """
 
 rule foldx_model:
@@ -80,6 +109,9 @@ rule foldx_model:
         "data/foldx/{structure}/processing/Raw_{n}_model_Repair.fxout",
         "data/foldx/{structure}/processing/PdbList_{n}_model_Repair.fxout"
 
+    params:
+        runs = FOLDX_RUNS
+
     resources:
         mem_mb = 4000
 
@@ -87,12 +119,46 @@ rule foldx_model:
         "logs/foldx_model/{structure}_{n}.log"
 
     shell:
-        'foldx --command=BuildModel --pdb=model_Repair.pdb --pdb-dir=data/foldx/{wildcards.structure} --mutant-file={input.muts} --output-file="{wildcards.n}" --output-dir=data/foldx/{wildcards.structure}/processing --numberOfRuns=3 --clean-mode=3 --out-pdb=false &> {log}'
+        'foldx --command=BuildModel --pdb=model_Repair.pdb --pdb-dir=data/foldx/{wildcards.structure} --mutant-file={input.muts} --output-file="{wildcards.n}" --output-dir=data/foldx/{wildcards.structure}/processing --numberOfRuns={params.runs} --clean-mode=3 --out-pdb=false &> {log}'
+
+rule foldx_schedule:
+    """
+    Run FoldX BuildModel on all variants for a structure on a single node, using
+    dynamically sized batches pulled by a pool of local workers. Per mutation timings,
+    estimated as batch averages, are kept between runs to size later batches.
+    """
+    input:
+        pdb="data/foldx/{structure}/model_Repair.pdb",
+        muts=f"data/foldx/{{structure}}/{FOLDX_LIST}"
+
+    output:
+        directory("data/foldx/{structure}/scheduled")
+
+    params:
+        runs = FOLDX_RUNS
+
+    threads:
+        config['foldx'].get('processes', 8)
+
+    resources:
+        mem_mb = lambda wildcards, threads: 4000 * threads
+
+    log:
+        "logs/foldx_schedule/{structure}.log"
+
+    shell:
+        "python bin/foldx_schedule.py --processes {threads} --runs {params.runs} --timings data/foldx/{wildcards.structure}/timings.tsv {input.pdb} {input.muts} {output} &> {log}"
 
 def get_foldx_split_files(wildcards):
     """
-    Retrieve the IDs of split FoldX jobs
+    Retrieve the IDs of split FoldX jobs, or the output of foldx_schedule when FoldX is
+    run locally, along with the full variant list and PDB used to merge cached results
     """
+    inputs = [f'data/foldx/{wildcards.structure}/model_Repair.pdb',
+              f'data/foldx/{wildcards.structure}/individual_list']
+    if FOLDX_DIR == 'scheduled':
+        return inputs + [f'data/foldx/{wildcards.structure}/scheduled']
+
     checkpoint_outdir = checkpoints.foldx_split.get(structure=wildcards.structure).output[0]
     fx_output = expand('data/foldx/{structure}/processing/{fi}_{n}_model_Repair.fxout',
                        structure=wildcards.structure,
@@ -101,7 +167,7 @@ def get_foldx_split_files(wildcards):
     in_lists = expand('data/foldx/{structure}/processing/individual_list_{n}',
                       structure=wildcards.structure,
                       n=glob_wildcards(os.path.join(checkpoint_outdir, "individual_list_{n}")).n)
-    return fx_output + in_lists
+    return inputs + fx_output + in_lists
 
 rule foldx_combine:
     """
@@ -115,16 +181,25 @@ rule foldx_combine:
         "data/foldx/{structure}/dif.fxout",
         "data/foldx/{structure}/raw.fxout"
 
+    params:
+        dir = FOLDX_DIR,
+        cache = lambda wildcards: (
+            f"--cache {FOLDX_CACHE} --version '{config['foldx'].get('version', '')}' "
+            f"--runs {FOLDX_RUNS} --pdb data/foldx/{wildcards.structure}/model_Repair.pdb "
+            f"--mutations data/foldx/{wildcards.structure}/individual_list"
+        ) if FOLDX_CACHE else ''
+
     log:
         "logs/foldx_combine/{structure}.log"
 
     shell:
         """
-        python bin/foldx_combine.py --foldx data/foldx/{wildcards.structure}/processing/Average_*_model_Repair.fxout --variants data/foldx/{wildcards.structure}/processing/individual_list_* --type=average > data/foldx/{wildcards.structure}/average.fxout 2>> {log}
+        shopt -s nullglob
+        python bin/foldx_combine.py --foldx data/foldx/{wildcards.structure}/{params.dir}/Average_*_model_Repair.fxout --variants data/foldx/{wildcards.structure}/{params.dir}/individual_list_* --type=average {params.cache} > data/foldx/{wildcards.structure}/average.fxout 2>> {log}
 
-        python bin/foldx_combine.py --foldx data/foldx/{wildcards.structure}/processing/Dif_*_model_Repair.fxout --variants data/foldx/{wildcards.structure}/processing/individual_list_* --type=dif > data/foldx/{wildcards.structure}/dif.fxout 2>> {log}
+        python bin/foldx_combine.py --foldx data/foldx/{wildcards.structure}/{params.dir}/Dif_*_model_Repair.fxout --variants data/foldx/{wildcards.structure}/{params.dir}/individual_list_* --type=dif {params.cache} > data/foldx/{wildcards.structure}/dif.fxout 2>> {log}
 
-        python bin/foldx_combine.py --foldx data/foldx/{wildcards.structure}/processing/Raw_*_model_Repair.fxout --variants data/foldx/{wildcards.structure}/processing/individual_list_* --type=raw > data/foldx/{wildcards.structure}/raw.fxout 2>> {log}
+        python bin/foldx_combine.py --foldx data/foldx/{wildcards.structure}/{params.dir}/Raw_*_model_Repair.fxout --variants data/foldx/{wildcards.structure}/{params.dir}/individual_list_* --type=raw {params.cache} > data/foldx/{wildcards.structure}/raw.fxout 2>> {log}
         """
 
 checkpoint foldx_model_list:
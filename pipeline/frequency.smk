@@ -4,6 +4,13 @@ Rules for determining variant frequencies
 from snakemake.remote.FTP import RemoteProvider as FTPRemoteProvider
 FTP = FTPRemoteProvider()
 
+# Sample subsets generated by sample_subsets.py
+FREQUENCY_SUBSETS = [
+    'overall', 'Caribbean', 'CentralAmerica', 'CentralAsia', 'EastAsia',
+    'Europe', 'NorthAfrica', 'NorthAmerica', 'Oceania', 'SouthAmerica',
+    'SouthAsia', 'SouthEastAsia', 'SubSaharanAfrica', 'UnitedKingdom', 'WestAsia'
+]
+
 def get_covid_genome(wildcards):
     """
     Identify genome fasta source, based on config
@@ -81,112 +88,111 @@ rule index_annotation:
         tabix -p gff {output.gz} 2> {log}
         """
 
-rule unzip_variant_vcf:
+rule filter_problematic_sites:
     """
-    Unzip variants VCF file
+    Identify problematic genome positions to filter
     """
     input:
-        vcf=config['frequency']['vcf']
+        sites="data/frequency/problematic_sites_sarsCov2.vcf"
 
     output:
-        vcf="data/frequency/variants.unfiltered.vcf"
+        "data/frequency/filtered_sites.tsv"
 
     log:
-        "logs/unzip_variant_vcf.log"
+        "logs/filter_problematic_sites.log"
 
     shell:
-        """
-        gunzip -c {input.vcf} > {output.vcf} 2> {log}
-        """
+        "python bin/filter_problematic_sites.py --filter seq_end ambiguous highly_ambiguous interspecific_contamination nanopore_adapter narrow_src single_src -- {input.sites} > {output} 2> {log}"
 
-rule filter_problematic_sites:
+rule genotype_matrix:
     """
-    Identify and filter problematic genome positions
+    Convert the variants VCF into a memory-mapped genotype matrix, excluding problematic sites.
+    A copy of the filtered VCF without genotypes is output in the same pass for VEP. The
+    matrix is rebuilt from the full VCF for each release, only allele counting is incremental.
     """
     input:
-        sites="data/frequency/problematic_sites_sarsCov2.vcf",
-        vcf="data/frequency/variants.unfiltered.vcf"
+        vcf=config['frequency']['vcf'],
+        sites="data/frequency/filtered_sites.tsv"
 
     output:
-        tbl="data/frequency/filtered_sites.tsv",
-        vcf="data/frequency/variants.filtered.vcf"
+        matrix=directory("data/frequency/genotypes"),
+        vcf="data/frequency/variants.nosamples.vcf"
 
     log:
-        "logs/filter_problematic_sites.log"
+        "logs/genotype_matrix.log"
 
     shell:
-        """
-        python bin/filter_problematic_sites.py --filter seq_end ambiguous highly_ambiguous interspecific_contamination nanopore_adapter narrow_src single_src -- {input.sites} > {output.tbl} 2> {log}
-        vcftools --vcf {input.vcf} --exclude-positions {output.tbl} --recode --recode-INFO-all --stdout > {output.vcf} 2> {log}
-        """
+        "python bin/genotype_matrix.py --exclude {input.sites} --sites_vcf {output.vcf} {input.vcf} {output.matrix} &> {log}"
 
 rule sample_subsets:
     """
-    Generate sample subsets from VCF file
+    Generate sample subsets from the genotype matrix samples
     """
     input:
-        vcf="data/frequency/variants.filtered.vcf"
+        matrix="data/frequency/genotypes"
 
     output:
         "data/frequency/samples.tsv",
         "data/frequency/subsets/summary.tsv",
-        "data/frequency/subsets/overall.samples",
-        "data/frequency/subsets/last90days.samples",
-        "data/frequency/subsets/last180days.samples",
-        "data/frequency/subsets/Caribbean.samples",
-        "data/frequency/subsets/CentralAmerica.samples",
-        "data/frequency/subsets/CentralAsia.samples",
-        "data/frequency/subsets/EastAsia.samples",
-        "data/frequency/subsets/Europe.samples",
-        "data/frequency/subsets/NorthAfrica.samples",
-        "data/frequency/subsets/NorthAmerica.samples",
-        "data/frequency/subsets/Oceania.samples",
-        "data/frequency/subsets/SouthAmerica.samples",
-        "data/frequency/subsets/SouthAsia.samples",
-        "data/frequency/subsets/SouthEastAsia.samples",
-        "data/frequency/subsets/SubSaharanAfrica.samples",
-        "data/frequency/subsets/UnitedKingdom.samples",
-        "data/frequency/subsets/WestAsia.samples"
+        expand("data/frequency/subsets/{subset}.samples", subset=FREQUENCY_SUBSETS)
 
     log:
         "logs/sample_subsets.log"
 
     shell:
-        "python bin/sample_subsets.py --dir data/frequency/subsets --tsv data/frequency/samples.tsv --summary data/frequency/subsets/summary.tsv {input.vcf} &> {log}"
+        "python bin/sample_subsets.py --dir data/frequency/subsets --tsv data/frequency/samples.tsv --summary data/frequency/subsets/summary.tsv {input.matrix} &> {log}"
 
 rule variant_frequencies:
     """
-    Calculate allele frequencies from a subset of samples in a VCF file
+    Calculate allele frequencies for each subset of samples in a single pass over the genotype matrix
     """
     input:
-        vcf="data/frequency/variants.filtered.vcf",
-        subset="data/frequency/subsets/{subset}.samples"
+        matrix="data/frequency/genotypes",
+        subsets=expand("data/frequency/subsets/{subset}.samples", subset=FREQUENCY_SUBSETS)
 
     output:
-        "data/frequency/subsets/{subset}.tsv"
+        expand("data/frequency/subsets/{subset}.tsv", subset=FREQUENCY_SUBSETS)
+
+    params:
+        # Keep counts between runs to only process new samples when the VCF is updated
+        counts=f"--counts {config['frequency']['counts_dir']}" if config['frequency'].get('counts_dir') else ''
 
     log:
-        "logs/variant_frequencies/{subset}.log"
+        "logs/variant_frequencies.log"
 
     shell:
-        "vcftools --vcf {input.vcf} --keep {input.subset} --freq --stdout > {output} 2> {log}"
+        "python bin/allele_frequencies.py --dir data/frequency/subsets {params.counts} {input.matrix} {input.subsets} 2> {log}"
 
-rule strip_vcf_samples:
+def get_window_args(wildcards):
+    """
+    Determine time windows to calculate frequencies over, based on config
     """
-    Generate VCF with all genotype data striped for VEP input
+    args = [f"--bucket {config['frequency'].get('window_bucket', 'day')}"]
+    if config['frequency'].get('windows'):
+        args.append(f"--last {' '.join(str(i) for i in config['frequency']['windows'])}")
+    if config['frequency'].get('rolling_window'):
+        args.append(f"--rolling {' '.join(str(i) for i in config['frequency']['rolling_window'])}")
+    return ' '.join(args)
+
+rule window_frequencies:
+    """
+    Calculate allele frequencies over time windows in a single pass over the genotype matrix
     """
     input:
-        vcf="data/frequency/variants.filtered.vcf",
-        subset="data/frequency/subsets/overall.samples"
+        matrix="data/frequency/genotypes"
 
     output:
-        "data/frequency/variants.nosamples.vcf"
+        windows=directory("data/frequency/windows"),
+        summary="data/frequency/window_summary.tsv"
+
+    params:
+        windows=get_window_args
 
     log:
-        "logs/strip_vcf_samples.log"
+        "logs/window_frequencies.log"
 
     shell:
-        "vcftools --vcf {input.vcf} --remove {input.subset} --recode --stdout > {output} 2> {log}"
+        "python bin/window_frequencies.py --dir {output.windows} --summary {output.summary} {params.windows} {input.matrix} 2> {log}"
 
 rule annotate_variants:
     """
@@ -212,35 +218,35 @@ rule annotate_variants:
     shell:
         "vep --coding_only --species covid19  --tab --stats_text --synonyms {input.synonyms} --format vcf --fasta {input.fasta} --gff {input.gff} -i {input.vcf} -o {output.tsv} &> {log}"
 
+def get_frequency_tables(wildcards):
+    """
+    Frequency tables in frequency.tsv column order: overall, the configured lastNdays windows
+    and then the remaining subsets. Rolling windows are named by date, so are added after these
+    from the window summary.
+    """
+    windows = [f"data/frequency/windows/last{i}days.tsv"
+               for i in config['frequency'].get('windows', [])]
+    subsets = [f"data/frequency/subsets/{i}.tsv" for i in FREQUENCY_SUBSETS]
+    return ' '.join(subsets[:1] + windows + subsets[1:])
+
 rule frequency_tsv:
     """
     Generate tsv file of observed variant frequencies
     """
     input:
-        "data/frequency/variant_annotation.tsv",
-        "data/frequency/subsets/overall.tsv",
-        "data/frequency/subsets/last90days.tsv",
-        "data/frequency/subsets/last180days.tsv",
-        "data/frequency/subsets/Caribbean.tsv",
-        "data/frequency/subsets/CentralAmerica.tsv",
-        "data/frequency/subsets/CentralAsia.tsv",
-        "data/frequency/subsets/EastAsia.tsv",
-        "data/frequency/subsets/Europe.tsv",
-        "data/frequency/subsets/NorthAfrica.tsv",
-        "data/frequency/subsets/NorthAmerica.tsv",
-        "data/frequency/subsets/Oceania.tsv",
-        "data/frequency/subsets/SouthAmerica.tsv",
-        "data/frequency/subsets/SouthAsia.tsv",
-        "data/frequency/subsets/SouthEastAsia.tsv",
-        "data/frequency/subsets/SubSaharanAfrica.tsv",
-        "data/frequency/subsets/UnitedKingdom.tsv",
-        "data/frequency/subsets/WestAsia.tsv"
+        vep="data/frequency/variant_annotation.tsv",
+        subsets=expand("data/frequency/subsets/{subset}.tsv", subset=FREQUENCY_SUBSETS),
+        windows="data/frequency/windows",
+        window_summary="data/frequency/window_summary.tsv"
 
     output:
         "data/output/frequency.tsv"
 
+    params:
+        tables=get_frequency_tables
+
     log:
         "logs/frequency_tsv.log"
 
     shell:
-        "python bin/frequency_tsv.py {input} > {output} 2> {log}"
+        "python bin/frequency_tsv.py {input.vep} {params.tables} $(awk 'NR > 1 && /^rolling_/ {{print \"{input.windows}/\" $1 \".tsv\"}}' {input.window_summary}) > {output} 2> {log}"
@@ -64,7 +64,8 @@ rule ptms_tsv:
 
 rule naccess_tsv:
     """
-    Use Naccess to calculate surface accessibility for each PDB file downloaded from SWISS-Model
+    Use Naccess (or the built in SASA backend) to calculate surface accessibility for each PDB
+    file downloaded from SWISS-Model
     """
     input:
         [f'data/swissmodel/{i}.models' for i in SWISSMODEL_IDS.keys()]
@@ -73,18 +74,25 @@ rule naccess_tsv:
         dir=directory('data/naccess'),
         tsv='data/output/naccess.tsv'
 
+    params:
+        backend=config.get('accessibility', {}).get('backend', 'naccess'),
+        cache=config['general'].get('structure_cache', '')
+
+    threads: 8
+
     log:
         'logs/naccess_tsv.log'
 
     shell:
-        'python bin/surface_accessibility.py --dir {output.dir} {input} > {output.tsv} 2> {log}'
+        "python bin/surface_accessibility.py --backend {params.backend} --cache '{params.cache}' --processes {threads} --dir {output.dir} {input} > {output.tsv} 2> {log}"
 
 rule summary_tsv:
     """
     Generate summary output table
     """
     input:
-        sift="data/output/sift.tsv",
+        sift="data/output/sift.json",
+        sift_table="data/output/sift.npy",
         foldx="data/output/foldx.tsv",
         ptm="data/output/ptms.tsv",
         complex="data/output/complex.tsv",
@@ -94,10 +102,12 @@ rule summary_tsv:
         annotation="docs/annotation.tsv"
 
     output:
-        "data/output/summary.tsv"
+        tsv="data/output/summary.tsv",
+        parquet=directory("data/output/summary.parquet"),
+        shards=directory("data/output/summary_shards")
 
     log:
         "logs/summary_tsv.log"
 
     shell:
-        "python bin/summary_tsv.py {input.sift} {input.foldx} {input.ptm} {input.complex} {input.frequency} {input.accessibility} {input.antibodies} {input.annotation} > {output} 2> {log}"
+        "python bin/summary_tsv.py --parquet {output.parquet} --shards {output.shards} {input.sift} {input.foldx} {input.ptm} {input.complex} {input.frequency} {input.accessibility} {input.antibodies} {input.annotation} > {output.tsv} 2> {log}"
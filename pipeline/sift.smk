@@ -26,13 +26,15 @@ rule sift4g_download_database:
 
 rule sift4g_cluster_database:
     """
-    Generate the DB fasta file for SIFT4G using MMseqs2
+    Generate the DB fasta file for SIFT4G using MMseqs2, after removing exact and
+    near-exact duplicates
     """
     input:
         fasta=ancient("data/sift/database/coronaviridae.fa")
 
     output:
         filtered_fasta="data/sift/database/coronaviridae_filtered.fa",
+        mapping="data/sift/database/coronaviridae_filtered.tsv",
         db_dir=directory("data/sift/database/db"),
         clustered_fasta="data/sift/database/coronaviridae_clustered.fa"
 
@@ -46,7 +48,7 @@ rule sift4g_cluster_database:
 
     shell:
         """
-        python bin/filter_sift_db.py {input.fasta} > {output.filtered_fasta} 2>> {log}
+        python bin/filter_sift_db.py --mapping {output.mapping} {input.fasta} > {output.filtered_fasta} 2>> {log}
         mkdir {output.db_dir} &>> {log}
         mmseqs createdb {output.filtered_fasta} {output.db_dir}/db &>> {log}
         mkdir tmp &>> {log}
@@ -72,43 +74,96 @@ rule sift4g_variants:
     shell:
         "python bin/sift_variants.py {input.fa} > {output} 2> {log}"
 
-# TODO can easily multi-thread sift here if needed
-rule sift4g:
+SIFT_BATCH = config.get('sift', {}).get('batch', False)
+SIFT_BATCH_GENES = [gene for gene in GENES if not gene in SIFT_GENE_ERRORS]
+
+if SIFT_BATCH:
+    rule sift4g_batch:
+        """
+        Run SIFT4G on all genes in a single multi-threaded job, so the database is only
+        loaded once
+        """
+        input:
+            fa = [f"data/fasta/{gene}.fa" for gene in SIFT_BATCH_GENES],
+            subst = [f"data/sift/{gene}.subst" for gene in SIFT_BATCH_GENES],
+            db = "data/sift/database/coronaviridae_clustered.fa"
+
+        output:
+            [f"data/sift/{gene}.SIFTprediction" for gene in SIFT_BATCH_GENES],
+            [f"data/sift/{gene}.aligned.fasta" for gene in SIFT_BATCH_GENES]
+
+        threads: config.get('sift', {}).get('threads', 8)
+
+        log:
+            'logs/sift4g_batch.log'
+
+        resources:
+            mem_mb = 16000
+
+        shell:
+            "python bin/sift4g_batch.py --threads {threads} --db {input.db} --subst data/sift --output data/sift {input.fa} &> {log}"
+
+else:
+    rule sift4g:
+        """
+        Run SIFT4G on a FASTA file, assessing all possible variants.
+        Note: I am using a modified version of SIFT4G that
+        outputs to 4dp rather than 2.
+        """
+        input:
+            fa = "data/fasta/{gene}.fa",
+            subst = "data/sift/{gene}.subst",
+            db = "data/sift/database/coronaviridae_clustered.fa"
+
+        output:
+            "data/sift/{gene}.SIFTprediction",
+            "data/sift/{gene}.aligned.fasta"
+
+        log:
+            'logs/sift4g/{gene}.log'
+
+        resources:
+            mem_mb = 8000
+
+        shell:
+            "sift4g --sub-results --subst data/sift/ -q {input.fa} -d {input.db} --out data/sift &> {log}"
+
+rule sift_tsv:
     """
-    Run SIFT4G on a FASTA file, assessing all possible variants.
-    Note: I am using a modified version of SIFT4G that
-    outputs to 4dp rather than 2.
+    Combine data from SIFT4G into a single table
     """
     input:
-        fa = "data/fasta/{gene}.fa",
-        subst = "data/sift/{gene}.subst",
-        db = "data/sift/database/coronaviridae_clustered.fa"
+        [f"data/sift/{gene}.SIFTprediction" for gene in GENES if not gene in SIFT_GENE_ERRORS]
 
     output:
-        "data/sift/{gene}.SIFTprediction",
-        "data/sift/{gene}.aligned.fasta"
+        tsv="data/output/sift.tsv",
+        table="data/output/sift.npy",
+        index="data/output/sift.json"
 
-    log:
-        'logs/sift4g/{gene}.log'
+    threads: 4
 
-    resources:
-        mem_mb = 8000
+    log:
+        "logs/sift_tsv.log"
 
     shell:
-        "sift4g --sub-results --subst data/sift/ -q {input.fa} -d {input.db} --out data/sift &> {log}"
+        "python bin/sift_tsv.py --processes {threads} --binary data/output/sift {input} > {output.tsv} 2> {log}"
 
-rule sift_tsv:
+rule sift_alignment_profile:
     """
-    Combine data from SIFT4G into a single table
+    Calculate per position conservation profiles from a SIFT4G alignment
     """
     input:
-        [f"data/sift/{gene}.SIFTprediction" for gene in GENES if not gene in SIFT_GENE_ERRORS]
+        "data/sift/{gene}.aligned.fasta"
 
     output:
-        "data/output/sift.tsv"
+        json="data/sift/{gene}.profile.json",
+        tsv="data/sift/{gene}.profile.tsv"
 
     log:
-        "logs/sift_tsv.log"
+        "logs/sift_alignment_profile/{gene}.log"
+
+    params:
+        query=lambda wildcards: wildcards.gene.split('_')[1]
 
     shell:
-        "python bin/sift_tsv.py {input} > {output} 2> {log}"
+        "python bin/alignment_profile.py --query '{params.query}' --tsv {output.tsv} {input} > {output.json} 2> {log}"
@@ -64,8 +64,13 @@ rule swissmodel_select:
     output:
         'data/swissmodel/{gene_id}.models'
 
+    params:
+        method=config['swissmodel'].get('selection', 'greedy'),
+        model_cost=config['swissmodel'].get('model_cost', 20),
+        fragment_cost=config['swissmodel'].get('fragment_cost', 5)
+
     log:
         'logs/swissmodel_select/{gene_id}.log'
 
     shell:
-        'python bin/swissmodel_select.py --seq_id {config[swissmodel][min_seq_id]} --qmean_z {config[swissmodel][min_qmean_z]} data/swissmodel/{wildcards.gene_id} > {output} 2> {log}'
+        'python bin/swissmodel_select.py --seq_id {config[swissmodel][min_seq_id]} --qmean_z {config[swissmodel][min_qmean_z]} --method {params.method} --model_cost {params.model_cost} --fragment_cost {params.fragment_cost} data/swissmodel/{wildcards.gene_id} > {output} 2> {log}'
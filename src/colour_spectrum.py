@@ -31,6 +31,12 @@ class ColourPalette:
     def __call__(self, value):
         return self.colourmap.get(value, self.na_colour)
 
+    def map_array(self, values):
+        """
+        Map an iterable of values to an array of hexcodes
+        """
+        return np.array([self(i) for i in values], dtype='<U8')
+
     def plot(self, horizontal=False):
         """
         Plot the palette as a free legend
@@ -93,6 +99,7 @@ class ColourSpectrum:
         self.na_outside_range = na_outside_range
 
         self.name = name
+        self._lookup = None
 
     def __call__(self, val):
         if np.isnan(val):
@@ -105,6 +112,45 @@ class ColourSpectrum:
         rgb = [rgb_clamp(x * 255) for x in rgb[:3]]
         return rgb_to_hex(rgb)
 
+    @property
+    def lookup(self):
+        """
+        Array of hexcodes for each colourmap entry, followed by the colourmap's under, over
+        and bad colours and na_colour. Generated on first use.
+        """
+        if self._lookup is None:
+            size = self.colourmap.N
+            rgba = np.vstack([self.colourmap(np.arange(size)), self.colourmap.get_under(),
+                              self.colourmap.get_over(), self.colourmap.get_bad()])
+            rgb = np.clip(rgba[:, :3] * 255, 0, 255).astype(int)
+            self._lookup = np.array([rgb_to_hex(i) for i in rgb] + [self.na_colour],
+                                    dtype='<U8')
+        return self._lookup
+
+    def map_array(self, values):
+        """
+        Map an array of values to an array of hexcodes, giving the same results as calling
+        the spectrum on each value. Values are converted to colourmap indices in the same way
+        as matplotlib and then mapped through a precomputed lookup table.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        size = self.colourmap.N
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scaled = (values - self.minimum) / (self.maximum - self.minimum) * size
+        scaled[scaled == size] = size - 1
+
+        index = np.full(values.shape, size + 2)
+        valid = (scaled >= 0) & (scaled < size)
+        index[valid] = scaled[valid].astype(int)
+        index[scaled < 0] = size
+        index[scaled >= size] = size + 1
+
+        na_values = np.isnan(values)
+        if self.na_outside_range:
+            na_values |= ~((self.minimum <= values) & (values <= self.maximum))
+        index[na_values] = size + 3
+        return self.lookup[index]
+
     def plot(self, horizontal=False):
         """
         Plot a colourbar of the spectrum as a free plot
@@ -0,0 +1,99 @@
+"""
+Content addressed cache of FoldX BuildModel results. Results are stored per structure in
+directories keyed by a hash of the repaired PDB coordinates, the FoldX version and the number
+of runs, so unchanged structures don't need remodelling when upstream steps are rerun. Each
+directory holds tables of per mutation rows in the format output by foldx_combine.py:
+
+average.tsv, dif.tsv, raw.tsv: Combined FoldX results
+key.json:                      Parameters used to generate the key
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+FOLDX_TYPES = ('average', 'dif', 'raw')
+
+def pdb_hash(path):
+    """
+    SHA-256 hash of the coordinate records of a PDB file, ignoring headers and remarks
+    that can change between otherwise identical FoldX runs
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as pdb_file:
+        for line in pdb_file:
+            if line.startswith((b'ATOM', b'HETATM', b'TER', b'MODEL', b'ENDMDL')):
+                sha.update(line.rstrip())
+    return sha.hexdigest()
+
+def mutation_ids(frame):
+    """
+    FoldX mutation strings (e.g. AA12G) for each row of a combined FoldX table
+    """
+    return frame.wt + frame.chain + frame.position.astype(str) + frame.mut
+
+class FoldXCache:
+    """
+    FoldX results for a single structure, FoldX version and number of runs
+
+    root:    Root cache directory
+    pdb:     Repaired PDB file
+    version: FoldX version string
+    runs:    FoldX numberOfRuns
+    """
+    def __init__(self, root, pdb, version='', runs=3):
+        self.version = str(version)
+        self.runs = int(runs)
+        self.pdb_hash = pdb_hash(pdb)
+        key = hashlib.sha256(f'{self.pdb_hash}:{self.version}:{self.runs}'.encode())
+        self.key = key.hexdigest()[:32]
+        self.path = f"{str(root).rstrip('/')}/{self.key}"
+
+    def __repr__(self):
+        return f'FoldXCache({self.path})'
+
+    def read(self, fx_type):
+        """
+        Read the cached table for a FoldX output type, or None if nothing is cached
+        """
+        path = f'{self.path}/{fx_type}.tsv'
+        if not os.path.isfile(path):
+            return None
+        return pd.read_csv(path, sep='\t', dtype={'chain': str, 'position': str})
+
+    def mutations(self):
+        """
+        Set of mutations with results cached for all FoldX output types
+        """
+        cached = None
+        for fx_type in FOLDX_TYPES:
+            frame = self.read(fx_type)
+            if frame is None:
+                return set()
+            muts = set(mutation_ids(frame))
+            cached = muts if cached is None else cached & muts
+        return cached
+
+    def update(self, fx_type, frame):
+        """
+        Add rows from a combined FoldX table to the cache, replacing any existing rows for
+        the same mutations
+        """
+        if frame.empty:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        if not os.path.isfile(f'{self.path}/key.json'):
+            with open(f'{self.path}/key.json', 'w') as key_file:
+                json.dump({'pdb_hash': self.pdb_hash, 'version': self.version,
+                           'runs': self.runs}, key_file)
+
+        cached = self.read(fx_type)
+        if cached is not None:
+            cached = cached[~mutation_ids(cached).isin(set(mutation_ids(frame)))]
+            frame = pd.concat([cached, frame])
+
+        frame.to_csv(f'{self.path}/{fx_type}.tsv.tmp', sep='\t', index=False,
+                     float_format='%.6g')
+        os.replace(f'{self.path}/{fx_type}.tsv.tmp', f'{self.path}/{fx_type}.tsv')
@@ -0,0 +1,195 @@
+"""
+Read genotype calls from VCF files and compact, memory-mapped genotype matrices converted
+from them
+"""
+import gzip
+import os
+
+import numpy as np
+
+MISSING = -1
+MATRIX_MISSING = 255
+
+def open_vcf(path):
+    """
+    Open a plain text or gzipped VCF file
+    """
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+def read_vcf_header(vcf_file):
+    """
+    Read through VCF meta-information lines, returning a list of the meta lines and the sample
+    names from the header line and leaving the file positioned at the first record
+    """
+    meta = []
+    for line in vcf_file:
+        if line.startswith('##'):
+            meta.append(line.rstrip('\n'))
+            continue
+
+        if line.startswith('#'):
+            return meta, line.rstrip('\n').split('\t')[9:]
+
+        raise ValueError(('Reached a line not starting with # before '
+                          'finding the header line, which should start with '
+                          'a single #'))
+
+    raise ValueError('No header line found in VCF file')
+
+def parse_genotypes(fmt, genotypes, n_samples):
+    """
+    Parse the genotype columns of a VCF record into an (n_samples, ploidy) array of allele
+    indices, with missing calls set to MISSING. Single character haploid calls, which make up
+    SARS-CoV-2 VCFs, are read directly from the raw bytes without splitting the line.
+    """
+    if fmt == 'GT' and len(genotypes) == 2 * n_samples - 1:
+        calls = np.frombuffer(genotypes.encode(), dtype=np.uint8)[::2].astype(np.int16)
+        calls -= ord('0')
+        calls[(calls < 0) | (calls > 9)] = MISSING
+        return calls.reshape(-1, 1)
+
+    gt_index = fmt.split(':').index('GT')
+    fields = [i.split(':')[gt_index].replace('|', '/').split('/') for i in genotypes.split('\t')]
+    calls = np.full((n_samples, max(len(i) for i in fields)), MISSING, dtype=np.int16)
+    for sample, alleles in enumerate(fields):
+        for index, allele in enumerate(alleles):
+            if not allele == '.':
+                calls[sample, index] = int(allele)
+    return calls
+
+def iter_vcf_records(vcf_file):
+    """
+    Iterate over the records of a VCF file, yielding the first 9 fields and the unparsed
+    genotype columns
+    """
+    for line in vcf_file:
+        yield line.rstrip('\n').split('\t', 9)
+
+def record_alleles(record):
+    """
+    List of alleles (REF then ALT) from a split VCF record
+    """
+    return [record[3]] + record[4].split(',') if not record[4] == '.' else [record[3]]
+
+def iter_vcf_sites(vcf_file, n_samples):
+    """
+    Iterate over (chrom, position, alleles, calls) for each record in a VCF file, with calls
+    parsed by parse_genotypes
+    """
+    for record in iter_vcf_records(vcf_file):
+        yield (record[0], record[1], record_alleles(record),
+               parse_genotypes(record[8], record[9], n_samples))
+
+class GenotypeMatrix:
+    """
+    Haploid genotype calls from a VCF file stored as a sites x samples matrix, with one byte
+    per call giving the allele index (MATRIX_MISSING for missing calls). The matrix is
+    memory-mapped, so subsets of samples can be selected by column without reading the whole
+    file into memory. Matrices are stored in a directory containing:
+
+    genotypes.u8: Raw uint8 matrix in row (site) major order
+    sites.tsv:    chrom, position, ref and alt of each site (matrix rows)
+    samples.txt:  Sample names (matrix columns), one per line
+    """
+    def __init__(self, path):
+        self.path = str(path).rstrip('/')
+
+        with open(f'{self.path}/samples.txt', 'r') as samples_file:
+            self.samples = [i.rstrip('\n') for i in samples_file]
+
+        self.sites = []
+        with open(f'{self.path}/sites.tsv', 'r') as sites_file:
+            next(sites_file)
+            for line in sites_file:
+                chrom, pos, ref, alt = line.rstrip('\n').split('\t')
+                self.sites.append((chrom, pos, [ref] + alt.split(',') if alt else [ref]))
+
+        shape = (len(self.sites), len(self.samples))
+        if shape[0] * shape[1] > 0:
+            self.genotypes = np.memmap(f'{self.path}/genotypes.u8', dtype=np.uint8,
+                                       mode='r', shape=shape)
+        else:
+            self.genotypes = np.zeros(shape, dtype=np.uint8)
+
+    def __repr__(self):
+        return (f'GenotypeMatrix({self.path}, sites={len(self.sites)}, '
+                f'samples={len(self.samples)})')
+
+    def sample_columns(self, samples):
+        """
+        Sorted array of column indices for the given sample names, ignoring unknown samples
+        """
+        sample_index = {s: i for i, s in enumerate(self.samples)}
+        return np.array(sorted({sample_index[s] for s in samples if s in sample_index}),
+                        dtype=np.int64)
+
+    def site_calls(self, index):
+        """
+        Calls for all samples at a site (matrix row), in the same format as iter_sites
+        """
+        calls = self.genotypes[index].astype(np.int16)
+        calls[calls == MATRIX_MISSING] = MISSING
+        return calls.reshape(-1, 1)
+
+    def iter_sites(self, columns=None, chunk_size=1024):
+        """
+        Iterate over (chrom, position, alleles, calls) for each site, in the same format as
+        iter_vcf_sites. Optionally only select calls from the given columns. The matrix is
+        read in chunks of sites to limit memory usage.
+        """
+        for start in range(0, len(self.sites), chunk_size):
+            chunk = self.genotypes[start:(start + chunk_size)]
+            if columns is not None:
+                chunk = chunk[:, columns]
+            chunk = chunk.astype(np.int16)
+            chunk[chunk == MATRIX_MISSING] = MISSING
+
+            for offset, calls in enumerate(chunk):
+                chrom, pos, alleles = self.sites[start + offset]
+                yield chrom, pos, alleles, calls.reshape(-1, 1)
+
+def write_genotype_matrix(vcf_file, path, exclude=None, sites_vcf=None):
+    """
+    Convert an open VCF file into a GenotypeMatrix directory at path, optionally skipping
+    (chrom, position) sites in exclude and writing the VCF with genotypes removed to
+    the file sites_vcf
+    """
+    exclude = exclude or set()
+    path = str(path).rstrip('/')
+    if not os.path.isdir(path):
+        os.mkdir(path)
+
+    meta, samples = read_vcf_header(vcf_file)
+    with open(f'{path}/samples.txt', 'w') as samples_file:
+        for sample in samples:
+            print(sample, file=samples_file)
+
+    if sites_vcf is not None:
+        print(*meta, sep='\n', file=sites_vcf)
+        print('#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO',
+              sep='\t', file=sites_vcf)
+
+    n_sites = 0
+    with open(f'{path}/sites.tsv', 'w') as sites_file, \
+         open(f'{path}/genotypes.u8', 'wb') as genotype_file:
+        print('chrom', 'position', 'ref', 'alt', sep='\t', file=sites_file)
+        for record in iter_vcf_records(vcf_file):
+            if (record[0], record[1]) in exclude:
+                continue
+
+            calls = parse_genotypes(record[8], record[9], len(samples))
+            if calls.shape[1] > 1:
+                raise ValueError(f'Non-haploid genotypes found at {record[0]}:{record[1]}, '
+                                 'only haploid calls can be stored in a GenotypeMatrix')
+
+            calls[calls == MISSING] = MATRIX_MISSING
+            genotype_file.write(calls.astype(np.uint8).tobytes())
+            print(record[0], record[1], record[3], '' if record[4] == '.' else record[4],
+                  sep='\t', file=sites_file)
+            if sites_vcf is not None:
+                print(*record[:8], sep='\t', file=sites_vcf)
+            n_sites += 1
+
+    return n_sites
@@ -1,21 +1,53 @@
 """
 Plot colours onto PDB structures using PyMol
 """
+import os
 from itertools import cycle
 import pandas as pd
 from colour_spectrum import ColourSpectrum
 
-def import_data():
+def import_data(columns=None, names=None, path=None):
     """
-    Utility function to imoprt summary tsv ready for usage in PyMol
+    Utility function to imoprt summary data ready for usage in PyMol. The Parquet dataset
+    (data/output/summary.parquet) is used if available, which allows only the selected
+    columns and proteins to be read, falling back to the summary tsv.
+
+    columns: Columns to import, or None for all columns
+    names:   Protein names to import, or None for all proteins
+    path:    Summary tsv or Parquet dataset directory, defaulting to those in data/output
     """
+    if path is None:
+        path = 'data/output/summary.parquet'
+        if not os.path.isdir(path):
+            path = 'data/output/summary.tsv'
+
+    if os.path.isdir(path):
+        filters = [('name', 'in', list(names))] if names is not None else None
+        summary = pd.read_parquet(path, columns=columns, filters=filters)
+        # Partition columns are read as categories of all partitions
+        for col in ('uniprot', 'name'):
+            if col in summary.columns:
+                summary[col] = summary[col].astype(str)
+        if columns is None:
+            columns = ['uniprot', 'name'] + [i for i in summary.columns
+                                             if not i in ('uniprot', 'name')]
+        return summary[list(columns)]
+
     col_types = {
         'sift_score': float, 'sift_median': float, 'total_energy': float,
         'interaction_energy': float, 'diff_interaction_energy': float,
         'diff_interface_residues': float, 'freq': float
     }
-    return pd.read_csv('data/output/summary.tsv', sep='\t', index_col=False,
-                       dtype=col_types, low_memory=False)
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) if names is None else list({*columns, 'name'})
+    summary = pd.read_csv(path, sep='\t', index_col=False, dtype=col_types,
+                          usecols=usecols, low_memory=False)
+    if names is not None:
+        summary = summary[summary.name.isin(names)].reset_index(drop=True)
+    if columns is not None:
+        summary = summary[list(columns)]
+    return summary
 
 def project_freq(cmd, df, name, chain):
     """
@@ -46,7 +78,8 @@ def project_landscape(cmd, chain, position, value, colourer=None, na_colour=None
     """
     Colour specific residues according to a colourmap. colourer must return a Hexcode
     when called with a value as well as have an 'na_colour' attribute if no na_colour
-    is specifically supplied. Chain can either be a single identifier (str) or an
+    is specifically supplied. Colourers with a map_array method (e.g. ColourSpectrum) are
+    used to colour all values at once. Chain can either be a single identifier (str) or an
     iterable of identifiers
     """
     if colourer is None:
@@ -55,18 +88,59 @@ def project_landscape(cmd, chain, position, value, colourer=None, na_colour=None
     if isinstance(chain, str):
         chain = cycle([chain])
 
-    colour_residues(cmd, *zip(chain, position, [colourer(val) for val in value]),
-                    base_colour=na_colour)
+    if hasattr(colourer, 'map_array'):
+        colours = colourer.map_array(value)
+    else:
+        colours = [colourer(val) for val in value]
 
-def colour_residues(cmd, *args, base_colour=None):
+    colour_residues(cmd, *zip(chain, position, colours), base_colour=na_colour)
+
+def residue_ranges(positions):
+    """
+    Compress positions into a PyMol resi selection string (e.g. 1-5+8+10-12). Negative
+    positions must be escaped, so are listed individually.
+    """
+    positions = sorted(set(positions))
+    ranges = []
+    start = end = None
+    for pos in positions:
+        if pos < 0:
+            ranges.append(f'\\{pos}')
+        elif end is not None and pos == end + 1:
+            end = pos
+        else:
+            if start is not None:
+                ranges.append(f'{start}-{end}' if end > start else f'{start}')
+            start = end = pos
+
+    if start is not None:
+        ranges.append(f'{start}-{end}' if end > start else f'{start}')
+    return '+'.join(ranges)
+
+def colour_residues(cmd, *args, base_colour=None, batch=True):
     """
     Colour multiple residues programatically. Each argument should be a
-    (chain, position index, hex code) tuple
+    (chain, position index, hex code) tuple. By default residues are grouped by chain and
+    colour, with one PyMol command per group. Later arguments take precedence when a
+    residue is given multiple times, as when colouring residues one at a time (batch=False).
     """
     if base_colour is not None:
         cmd.color(base_colour, 'polymer')
 
+    if not batch:
+        for chn, pos, col in args:
+            pos = int(pos)
+            pos = f'\\{pos}' if pos < 0 else pos # Negative indices must be escaped
+            cmd.color(col, f'polymer and chain {chn} and resi {pos}')
+        return
+
+    colours = {}
     for chn, pos, col in args:
-        pos = int(pos)
-        pos = f'\{pos}' if pos < 0 else pos # Negative indices must be escaped
-        cmd.color(col, f'polymer and chain {chn} and resi {pos}')
+        colours[(chn, int(pos))] = col
+
+    groups = {}
+    for (chn, pos), col in colours.items():
+        groups.setdefault((chn, col), []).append(pos)
+
+    for (chn, col), positions in groups.items():
+        cmd.color(col, f'polymer and chain {chn} and resi {residue_ranges(positions)}')
@@ -1,10 +1,14 @@
 """
 Class representing a region of a protein
 """
+import warnings
+from bisect import bisect_right
+
+import numpy as np
 
 class ProteinRegion:
     """
-    A protein region
+    A protein region, stored as sorted non-overlapping intervals of positions
 
     chain: string chain id
     positions: string representation of protein positions. Comma separated list of
@@ -17,17 +21,60 @@ class ProteinRegion:
         self.positions_str = positions
 
         if positions is None:
-            self.positions = None
+            self.intervals = None
 
         else:
-            self.positions = []
+            intervals = []
             for i in positions.split(','):
+                if not i.strip():
+                    continue
+
                 if ':' in i:
                     i = i.split(':')
-                    self.positions.extend(range(int(i[0]), int(i[1]) + 1))
+                    intervals.append((int(i[0]), int(i[1])))
 
                 else:
-                    self.positions.append(int(i))
+                    intervals.append((int(i), int(i)))
+            self.intervals = self._merge(intervals)
+
+    @classmethod
+    def from_intervals(cls, chain, intervals, accept_hetero=False):
+        """
+        Create a ProteinRegion from a list of (start, end) inclusive intervals
+        """
+        intervals = cls._merge(intervals)
+        positions = ','.join(str(s) if s == e else f'{s}:{e}' for s, e in intervals)
+        return cls(chain, positions, accept_hetero=accept_hetero)
+
+    @staticmethod
+    def _merge(intervals):
+        """
+        Sort intervals and merge those that overlap or are adjacent
+        """
+        merged = []
+        for start, end in sorted(i for i in intervals if i[0] <= i[1]):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @property
+    def intervals(self):
+        """Sorted list of (start, end) inclusive intervals, or None for the whole chain"""
+        return self._intervals
+
+    @intervals.setter
+    def intervals(self, intervals):
+        self._intervals = intervals
+        self._starts = None if intervals is None else [i[0] for i in intervals]
+
+    @property
+    def positions(self):
+        """Sorted list of positions in the region, or None for the whole chain"""
+        if self.intervals is None:
+            return None
+        return [p for start, end in self.intervals for p in range(start, end + 1)]
 
     def __repr__(self):
         return (f'ProteinRegion({self.chain}, {self.positions_str}, '
@@ -36,16 +83,100 @@ class ProteinRegion:
     def __str__(self):
         return self.__repr__()
 
+    def __len__(self):
+        if self.intervals is None:
+            raise TypeError('A region covering the whole chain has no length')
+        return sum(end - start + 1 for start, end in self.intervals)
+
+    def __bool__(self):
+        return self.intervals is None or bool(self.intervals)
+
     def __contains__(self, item):
         try:
             chain = item.full_id[2]
             position = item.id[1]
             hetero = not item.id[0] == ' '
         except AttributeError:
-            warnings.warn((f'Tried to check membership of "{residue}".'
+            warnings.warn((f'Tried to check membership of "{item}". '
                            'Only biopython Residues can be in a ProteinRegion'))
             return False
 
-        return (self.chain == chain and
-                (self.positions is None or position in self.positions) and
+        return (self.chain == chain and self.contains(position) and
                 (not hetero or self.accept_hetero))
+
+    def contains(self, position):
+        """
+        Check if a position is in the region, ignoring chain
+        """
+        if self.intervals is None:
+            return True
+        index = bisect_right(self._starts, position) - 1
+        return index >= 0 and position <= self.intervals[index][1]
+
+    def contains_many(self, positions):
+        """
+        Boolean array marking which of an array of positions are in the region, ignoring chain
+        """
+        positions = np.asarray(positions)
+        if self.intervals is None:
+            return np.ones(positions.shape, dtype=bool)
+        if not self.intervals:
+            return np.zeros(positions.shape, dtype=bool)
+
+        intervals = np.array(self.intervals, dtype=np.int64).reshape(-1, 2)
+        index = np.searchsorted(intervals[:, 0], positions, side='right') - 1
+        return (index >= 0) & (positions <= intervals[np.maximum(index, 0), 1])
+
+    def _check_finite(self, other):
+        """
+        Raise an error if either region covers the whole chain
+        """
+        if self.intervals is None or other.intervals is None:
+            raise ValueError('Set operations need regions with defined positions')
+
+    def union(self, *others):
+        """
+        Region containing positions in this region or any others. Set operations only
+        consider positions, and the result has this region's chain.
+        """
+        for other in others:
+            self._check_finite(other)
+        intervals = self.intervals + [i for other in others for i in other.intervals]
+        return ProteinRegion.from_intervals(self.chain, intervals, self.accept_hetero)
+
+    def difference(self, other):
+        """
+        Region containing positions in this region but not another
+        """
+        self._check_finite(other)
+        intervals = []
+        others = other.intervals
+        index = 0
+        for start, end in self.intervals:
+            # Skip intervals ending before this one, then cut out overlapping ones
+            while index < len(others) and others[index][1] < start:
+                index += 1
+            position = start
+            overlap = index
+            while overlap < len(others) and others[overlap][0] <= end:
+                if others[overlap][0] > position:
+                    intervals.append((position, others[overlap][0] - 1))
+                position = max(position, others[overlap][1] + 1)
+                overlap += 1
+            if position <= end:
+                intervals.append((position, end))
+        return ProteinRegion.from_intervals(self.chain, intervals, self.accept_hetero)
+
+    def intersection(self, other):
+        """
+        Region containing positions in both this region and another
+        """
+        return self.difference(self.difference(other))
+
+    def coverage(self, other):
+        """
+        Proportion of this region's positions that are also in another region
+        """
+        if not len(self):
+            return 0.0
+        return len(self.intersection(other)) / len(self)
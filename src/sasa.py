@@ -0,0 +1,210 @@
+"""
+Solvent accessible surface area calculation, using a vectorised Shrake-Rupley algorithm as a
+Naccess replacement. Neighbouring atoms are found using a spatial grid, then points spread over
+the expanded surface of each atom are tested against its neighbours in batches. Residue level
+results are output in the same format as Naccess RSA files, with absolute areas and areas
+relative to an extended Ala-X-Ala tripeptide, for all atoms, side chain, main chain, non-polar
+and polar atoms.
+
+Results are close to Naccess but not identical, since Naccess uses a different (slice based)
+algorithm and slightly different atom radii.
+"""
+import numpy as np
+import pandas as pd
+
+from structure_cache import Structure, from_entity, load_structure
+
+PROBE_RADIUS = 1.4
+N_POINTS = 100
+
+# Van der Waals radii (Chothia 1976, as used by Naccess)
+ELEMENT_RADII = {'C': 1.87, 'N': 1.65, 'O': 1.4, 'S': 1.85, 'SE': 1.8}
+DEFAULT_RADIUS = 1.8
+
+# Trigonal (carbonyl/aromatic) carbons, which have a smaller radius
+TRIGONAL_CARBONS = {
+    'ARG': {'CZ'}, 'ASN': {'CG'}, 'ASP': {'CG'}, 'GLN': {'CD'}, 'GLU': {'CD'},
+    'HIS': {'CG', 'CD2', 'CE1'}, 'PHE': {'CG', 'CD1', 'CD2', 'CE1', 'CE2', 'CZ'},
+    'TYR': {'CG', 'CD1', 'CD2', 'CE1', 'CE2', 'CZ'},
+    'TRP': {'CG', 'CD1', 'CD2', 'CE2', 'CE3', 'CZ2', 'CZ3', 'CH2'}
+}
+TRIGONAL_RADIUS = 1.76
+
+MAIN_CHAIN_ATOMS = {'N', 'CA', 'C', 'O', 'OXT'}
+POLAR_ELEMENTS = {'N', 'O'}
+
+AREA_TYPES = ('all_atoms', 'side_chain', 'main_chain', 'non_polar', 'all_polar')
+
+# Areas of residue X in extended Ala-X-Ala tripeptides, calculated using this module with the
+# default radii, probe and points on tripeptides built from Bio.PDB default internal coordinates
+# with phi = -120 and psi = 120. Columns are all_atoms, side_chain, main_chain, non_polar and
+# all_polar. Glycine CA is counted as main chain.
+REFERENCE_AREAS = {
+    'ALA': [106.54, 65.84, 40.70, 69.78, 36.75],
+    'ARG': [247.04, 206.34, 40.70, 84.03, 163.00],
+    'ASN': [158.09, 118.74, 39.35, 37.09, 121.00],
+    'ASP': [149.44, 110.09, 39.35, 48.65, 100.79],
+    'CYS': [139.50, 99.98, 39.53, 103.92, 35.58],
+    'GLN': [184.25, 143.55, 40.70, 50.44, 133.81],
+    'GLU': [174.97, 134.27, 40.70, 59.40, 115.57],
+    'GLY': [87.39, 0.00, 87.39, 39.87, 47.52],
+    'HIS': [187.11, 150.10, 37.01, 102.43, 84.68],
+    'ILE': [185.99, 145.12, 40.87, 150.41, 35.58],
+    'LEU': [185.99, 149.15, 36.84, 150.41, 35.58],
+    'LYS': [206.64, 165.95, 40.70, 111.44, 95.20],
+    'MET': [200.34, 161.98, 38.36, 165.92, 34.42],
+    'PHE': [204.43, 168.58, 35.85, 171.18, 33.25],
+    'PRO': [138.40, 100.78, 37.62, 108.66, 29.74],
+    'SER': [110.11, 73.54, 36.57, 46.94, 63.17],
+    'THR': [138.96, 100.41, 38.54, 73.82, 65.14],
+    'TRP': [254.81, 219.14, 35.67, 190.00, 64.81],
+    'TYR': [218.91, 183.07, 35.85, 142.32, 76.60],
+    'VAL': [155.09, 114.22, 40.87, 119.50, 35.58]
+}
+
+def sphere_points(n_points=N_POINTS):
+    """
+    Approximately evenly distributed points on the unit sphere, using the golden spiral
+    """
+    index = np.arange(n_points) + 0.5
+    phi = np.arccos(1 - 2 * index / n_points)
+    theta = np.pi * (1 + 5 ** 0.5) * index
+    return np.column_stack([np.cos(theta) * np.sin(phi),
+                            np.sin(theta) * np.sin(phi),
+                            np.cos(phi)])
+
+def atom_radii(names, resnames, elements):
+    """
+    Van der Waals radii for arrays of atom names, residue names and elements
+    """
+    radii = np.array([ELEMENT_RADII.get(i, DEFAULT_RADIUS) for i in elements])
+    trigonal = np.array([e == 'C' and (n == 'C' or n in TRIGONAL_CARBONS.get(r, ()))
+                         for n, r, e in zip(names, resnames, elements)], dtype=bool)
+    radii[trigonal] = TRIGONAL_RADIUS
+    return radii
+
+def neighbour_pairs(coords, radii):
+    """
+    Find all pairs of atoms (i, j) whose spheres overlap, using a grid with cells the size of the
+    largest possible contact distance. Returns arrays i and j, sorted by i.
+    """
+    cell_size = 2 * radii.max()
+    cells = np.floor((coords - coords.min(axis=0)) / cell_size).astype(np.int64) + 1
+    shape = cells.max(axis=0) + 2
+    keys = np.ravel_multi_index(cells.T, shape)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    pairs_i, pairs_j = [], []
+    for offset in np.ndindex(3, 3, 3):
+        neighbour_keys = np.ravel_multi_index((cells + np.array(offset) - 1).T, shape)
+        start = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+        end = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+        counts = end - start
+        i = np.repeat(np.arange(len(coords)), counts)
+        j = order[np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        pairs_i.append(i)
+        pairs_j.append(j)
+
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    distance = np.linalg.norm(coords[i] - coords[j], axis=1)
+    keep = (i != j) & (distance < radii[i] + radii[j])
+    i, j = i[keep], j[keep]
+    order = np.argsort(i, kind='stable')
+    return i[order], j[order]
+
+def shrake_rupley(coords, radii, probe=PROBE_RADIUS, n_points=N_POINTS, batch_size=20000):
+    """
+    Solvent accessible surface area of each atom, given (N, 3) coordinates and N radii
+
+    coords:     Atom coordinates
+    radii:      Atom Van der Waals radii
+    probe:      Solvent probe radius
+    n_points:   Number of points tested on each atom surface
+    batch_size: Number of atom pairs tested at once, which limits memory usage to around
+                batch_size * n_points * 9 bytes
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64) + probe
+    if len(coords) == 0:
+        return np.zeros(0)
+
+    sphere = sphere_points(n_points)
+    pairs_i, pairs_j = neighbour_pairs(coords, radii)
+    buried = np.zeros((len(coords), n_points), dtype=bool)
+
+    # Batches are split at atom boundaries, so each atom's pairs are tested together
+    starts = np.flatnonzero(np.diff(pairs_i, prepend=-1))
+    bounds = np.append(starts, len(pairs_i))
+    lower = 0
+    while lower < len(pairs_i):
+        upper = bounds[min(np.searchsorted(bounds, lower + batch_size), len(bounds) - 1)]
+        batch = starts[np.searchsorted(starts, lower):np.searchsorted(starts, upper)] - lower
+        i, j = pairs_i[lower:upper], pairs_j[lower:upper]
+
+        # Point p = c_i + r_i * s is inside atom j when |c_i - c_j + r_i * s|^2 < r_j^2, which
+        # expands to 2 * r_i * s.(c_i - c_j) < r_j^2 - r_i^2 - |c_i - c_j|^2
+        offset = coords[i] - coords[j]
+        threshold = radii[j] ** 2 - radii[i] ** 2 - np.einsum('ij,ij->i', offset, offset)
+        occluded = (offset @ sphere.T) * (2 * radii[i, None]) < threshold[:, None]
+        buried[i[batch]] = np.logical_or.reduceat(occluded, batch, axis=0)
+        lower = upper
+
+    exposed = 1 - buried.sum(axis=1) / n_points
+    return 4 * np.pi * radii ** 2 * exposed
+
+def residue_accessibility(structure, probe=PROBE_RADIUS, n_points=N_POINTS):
+    """
+    Calculate residue accessibility for a structure_cache.Structure or a Bio.PDB Structure,
+    Model or Chain, returning a pandas DataFrame in the format imported from Naccess RSA files.
+    Hydrogens, water and other hetero residues are ignored, as in Naccess.
+    """
+    if not isinstance(structure, Structure):
+        structure = Structure(from_entity(structure))
+
+    structure = structure.select(~structure.atoms['hetero'] &
+                                 ~np.isin(structure.atoms['element'], [b'H', b'D']))
+    if not len(structure):
+        columns = ['chain', 'position', 'insertion', 'wt'] + \
+                  [f'{t}_{s}' for t in AREA_TYPES for s in ('abs', 'rel')]
+        return pd.DataFrame(columns=columns)
+
+    names, resnames, elements = structure.names, structure.resnames, structure.elements
+    radii = atom_radii(names, resnames, elements)
+    area = shrake_rupley(structure.coords, radii, probe=probe, n_points=n_points)
+
+    starts = structure.residue_starts()
+    residue_ids = np.repeat(np.arange(len(starts)), np.diff(starts, append=len(structure)))
+    main_chain = np.isin(names, list(MAIN_CHAIN_ATOMS))
+    polar = np.isin(elements, list(POLAR_ELEMENTS))
+    masks = {'all_atoms': np.ones(len(structure), dtype=bool), 'side_chain': ~main_chain,
+             'main_chain': main_chain, 'non_polar': ~polar, 'all_polar': polar}
+
+    first = structure.atoms[starts]
+    df = pd.DataFrame({
+        'chain': [i.decode() or ' ' for i in first['chain']],
+        'position': first['resseq'].astype(int),
+        'insertion': [i.decode() or ' ' for i in first['icode']],
+        'wt': first['resname'].astype(str)
+    })
+
+    reference = np.array([REFERENCE_AREAS.get(i, [np.nan] * len(AREA_TYPES)) for i in df.wt])
+    for num, area_type in enumerate(AREA_TYPES):
+        absolute = np.bincount(residue_ids, weights=area * masks[area_type], minlength=len(df))
+        df[f'{area_type}_abs'] = absolute
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df[f'{area_type}_rel'] = np.where(reference[:, num] > 0,
+                                              100 * absolute / reference[:, num], np.nan)
+    return df
+
+def pdb_accessibility(path, chain=None, probe=PROBE_RADIUS, n_points=N_POINTS, cache=None):
+    """
+    Calculate residue accessibility for the first model in a PDB file (e.g. a FoldX mutant
+    model), optionally filtered to a single chain. Parsed structures are stored in the
+    structure cache directory cache, if given.
+    """
+    structure = load_structure(path, cache=cache).model(0)
+    if chain is not None:
+        structure = structure.chain(chain)
+    return residue_accessibility(structure, probe=probe, n_points=n_points)
@@ -0,0 +1,106 @@
+"""
+Typed binary storage for combined SIFT4G predictions. Rows are stored in a structured .npy
+table, grouped by protein, with a JSON index giving each protein's row range and the codes used
+for categorical columns. Tables are loaded as memory maps, so individual proteins can be read
+without parsing text.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SIFT_COLUMNS = ['uniprot', 'name', 'position', 'wt', 'mut', 'sift_prediction', 'sift_score',
+                'sift_median', 'num_aa', 'num_seq']
+
+SIFT_DTYPE = np.dtype([
+    ('protein', np.int16), ('position', np.int32), ('wt', 'S1'), ('mut', 'S1'),
+    ('sift_prediction', np.int8), ('sift_score', np.float32), ('sift_median', np.float32),
+    ('num_aa', np.int32), ('num_seq', np.int32)
+])
+
+def write_sift_table(prefix, tables):
+    """
+    Write a list of per protein SIFT data frames (with SIFT_COLUMNS) to PREFIX.npy, with the
+    index in PREFIX.json. Integer columns use -1 for missing values and the prediction
+    column stores codes into the index's predictions list, with -1 when missing.
+    """
+    prefix = Path(prefix)
+    predictions = sorted({p for t in tables for p in t['sift_prediction'].dropna().unique()})
+    codes = {p: i for i, p in enumerate(predictions)}
+
+    proteins = []
+    array = np.zeros(sum(len(t) for t in tables), dtype=SIFT_DTYPE)
+    start = 0
+    for num, table in enumerate(tables):
+        end = start + len(table)
+        rows = array[start:end]
+        rows['protein'] = num
+        rows['position'] = table['position']
+        rows['wt'] = table['wt'].str.encode('ascii')
+        rows['mut'] = table['mut'].str.encode('ascii')
+        rows['sift_prediction'] = table['sift_prediction'].map(codes).fillna(-1)
+        rows['sift_score'] = table['sift_score']
+        rows['sift_median'] = table['sift_median']
+        rows['num_aa'] = table['num_aa'].fillna(-1)
+        rows['num_seq'] = table['num_seq'].fillna(-1)
+
+        uniprot, name = (table[['uniprot', 'name']].iloc[0] if len(table) else ('', ''))
+        proteins.append({'uniprot': uniprot, 'name': name, 'start': start, 'end': end})
+        start = end
+
+    np.save(prefix.with_suffix('.npy'), array)
+    index = {'table': prefix.with_suffix('.npy').name, 'columns': SIFT_COLUMNS,
+             'predictions': predictions, 'proteins': proteins}
+    with open(prefix.with_suffix('.json'), 'w') as index_file:
+        json.dump(index, index_file, indent=1)
+
+def float_values(values):
+    """
+    Convert float32 values to float64 through their shortest decimal representation, so
+    values match those parsed from the original text
+    """
+    return np.array(values.astype(str), dtype=np.float64)
+
+class SiftTable:
+    """
+    Binary SIFT table written by write_sift_table, with the same read interface as
+    summary_tsv.TableIndex
+
+    path: Path to the JSON index
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'r') as index_file:
+            self.index = json.load(index_file)
+
+        self.table = np.load(self.path.parent / self.index['table'], mmap_mode='r')
+        self.predictions = np.array(self.index['predictions'] + [np.nan], dtype=object)
+        self.ranges = {(p['uniprot'], p['name']): (p['start'], p['end'])
+                       for p in self.index['proteins']}
+
+    def __repr__(self):
+        return f'SiftTable({self.path}, proteins={len(self.ranges)})'
+
+    def read(self, protein, usecols=None, dtype=None): # pylint: disable=unused-argument
+        """
+        Read the rows for a (uniprot, name) protein into a data frame, which is empty if the
+        protein isn't in the table. Missing integer values are returned as NaN.
+        """
+        start, end = self.ranges.get(protein, (0, 0))
+        rows = self.table[start:end]
+        columns = {
+            'uniprot': np.full(len(rows), protein[0], dtype=object),
+            'name': np.full(len(rows), protein[1], dtype=object),
+            'position': rows['position'].astype(np.int64),
+            'wt': rows['wt'].astype(str).astype(object),
+            'mut': rows['mut'].astype(str).astype(object),
+            'sift_prediction': self.predictions[rows['sift_prediction']],
+            'sift_score': float_values(rows['sift_score']),
+            'sift_median': float_values(rows['sift_median'])
+        }
+        for col in ('num_aa', 'num_seq'):
+            columns[col] = np.where(rows[col] < 0, np.nan, rows[col])
+
+        usecols = usecols or SIFT_COLUMNS
+        return pd.DataFrame({k: columns[k] for k in SIFT_COLUMNS if k in usecols})
@@ -0,0 +1,267 @@
+"""
+Parse PDB files into compact NumPy atom tables, which can be cached on disk. Tables are stored
+as structured .npy files named by a hash of the PDB file contents, so they are only parsed once
+and are loaded as memory maps afterwards. Structures provide the chain and residue information
+used by the pipeline scripts without creating Bio.PDB objects for every atom.
+"""
+import hashlib
+import os
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+# Increment when ATOM_DTYPE or parsing changes, to invalidate cached tables
+CACHE_VERSION = 1
+
+ATOM_DTYPE = np.dtype([
+    ('model', np.int16), ('hetero', np.bool_), ('serial', np.int32), ('name', 'S4'),
+    ('altloc', 'S1'), ('resname', 'S3'), ('chain', 'S1'), ('resseq', np.int32),
+    ('icode', 'S1'), ('coord', np.float32, (3,)), ('occupancy', np.float32),
+    ('bfactor', np.float32), ('element', 'S2'), ('residue', np.int32)
+])
+
+WATER_NAMES = {'HOH', 'WAT', 'H2O'}
+
+class Residue(namedtuple('Residue', ['full_id', 'id', 'resname'])):
+    """
+    Lightweight residue record, with the same id and full_id attributes as Bio.PDB Residues
+    """
+    __slots__ = ()
+
+    def get_resname(self):
+        """Residue name, as in Bio.PDB"""
+        return self.resname
+
+def content_hash(path):
+    """
+    SHA-256 hash of a file's contents and the cache version
+    """
+    sha = hashlib.sha256(f'structure_cache:{CACHE_VERSION}:'.encode())
+    with open(path, 'rb') as pdb_file:
+        for block in iter(lambda: pdb_file.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _columns(records, start, end):
+    """
+    Fixed width columns from an (N, 80) byte array, as stripped byte strings
+    """
+    return np.char.strip(np.ascontiguousarray(records[:, start:end]).view(f'S{end - start}')[:, 0])
+
+def _numbers(column, dtype):
+    """
+    Convert a column of byte strings to numbers, treating blanks as 0
+    """
+    return np.where(column == b'', b'0', column).astype(dtype)
+
+def parse_pdb(path):
+    """
+    Parse ATOM and HETATM records from a PDB file into an ATOM_DTYPE array. Models are numbered
+    from 0 and atoms are assigned a residue index, which changes whenever the model, chain,
+    residue number, insertion code or hetero flag changes.
+    """
+    lines = []
+    models = []
+    model = 0
+    seen_atoms = False
+    with open(path, 'rb') as pdb_file:
+        for line in pdb_file:
+            if line.startswith((b'ATOM  ', b'HETATM')):
+                lines.append(line.rstrip(b'\r\n')[:80].ljust(80))
+                models.append(model)
+                seen_atoms = True
+            elif line.startswith(b'ENDMDL') and seen_atoms:
+                model += 1
+                seen_atoms = False
+
+    atoms = np.zeros(len(lines), dtype=ATOM_DTYPE)
+    if not lines:
+        return atoms
+
+    records = np.frombuffer(b''.join(lines), dtype=np.uint8).reshape(-1, 80)
+    atoms['model'] = models
+    atoms['hetero'] = records[:, 0] == ord('H')
+    atoms['serial'] = _numbers(_columns(records, 6, 11), np.int32)
+    atoms['name'] = _columns(records, 12, 16)
+    atoms['altloc'] = _columns(records, 16, 17)
+    atoms['resname'] = _columns(records, 17, 20)
+    atoms['chain'] = _columns(records, 21, 22)
+    atoms['resseq'] = _numbers(_columns(records, 22, 26), np.int32)
+    atoms['icode'] = _columns(records, 26, 27)
+    atoms['coord'] = np.column_stack([_numbers(_columns(records, i, i + 8), np.float32)
+                                      for i in (30, 38, 46)])
+    atoms['occupancy'] = _numbers(_columns(records, 54, 60), np.float32)
+    atoms['bfactor'] = _numbers(_columns(records, 60, 66), np.float32)
+
+    # Guess missing elements from the first letter of the atom name, as Bio.PDB does
+    element = _columns(records, 76, 78)
+    missing = element == b''
+    element[missing] = [i.lstrip(b'0123456789')[:1] for i in atoms['name'][missing]]
+    atoms['element'] = np.char.upper(element)
+
+    keys = ('model', 'chain', 'resseq', 'icode', 'hetero')
+    changed = np.zeros(len(atoms), dtype=bool)
+    changed[0] = True
+    for key in keys:
+        changed[1:] |= atoms[key][1:] != atoms[key][:-1]
+    atoms['residue'] = np.cumsum(changed) - 1
+    return atoms
+
+def from_entity(entity):
+    """
+    Convert a Bio.PDB Structure, Model, Chain or Residue into an ATOM_DTYPE array, for example
+    to use structures that have been modified in memory
+    """
+    atoms = list(entity.get_atoms())
+    table = np.zeros(len(atoms), dtype=ATOM_DTYPE)
+    residues = {}
+    for num, atom in enumerate(atoms):
+        residue = atom.get_parent()
+        model = residue.get_parent().get_parent()
+        table[num] = (model.id if model is not None else 0,
+                      not residue.id[0] == ' ', atom.serial_number or 0, atom.get_id(),
+                      atom.altloc.strip(), residue.resname, residue.get_parent().id,
+                      residue.id[1], residue.id[2].strip(), atom.coord, atom.occupancy or 0,
+                      atom.bfactor or 0, atom.element.upper(),
+                      residues.setdefault(id(residue), len(residues)))
+    return table
+
+class Structure:
+    """
+    Atoms of a PDB structure, stored as an ATOM_DTYPE array
+
+    atoms: ATOM_DTYPE array, from parse_pdb or a cache file
+    name:  Structure name, used in residue full_ids
+    """
+    def __init__(self, atoms, name=''):
+        self.atoms = atoms
+        self.name = name
+
+    def __repr__(self):
+        return f'Structure({self.name}, atoms={len(self.atoms)})'
+
+    def __len__(self):
+        return len(self.atoms)
+
+    @property
+    def coords(self):
+        """(N, 3) array of atom coordinates"""
+        return self.atoms['coord']
+
+    @property
+    def elements(self):
+        """Atom elements, as strings"""
+        return self.atoms['element'].astype(str)
+
+    @property
+    def names(self):
+        """Atom names, as strings"""
+        return self.atoms['name'].astype(str)
+
+    @property
+    def resnames(self):
+        """Residue names for each atom, as strings"""
+        return self.atoms['resname'].astype(str)
+
+    def select(self, mask):
+        """
+        New Structure containing atoms matching a boolean mask
+        """
+        return Structure(self.atoms[mask], name=self.name)
+
+    def model(self, model=0):
+        """
+        New Structure containing a single model
+        """
+        return self.select(self.atoms['model'] == model)
+
+    def chain(self, chain):
+        """
+        New Structure containing a single chain
+        """
+        return self.select(self.atoms['chain'] == chain.strip().encode())
+
+    def chains(self, model=0):
+        """
+        List of chain IDs in a model, in file order
+        """
+        chains = self.atoms['chain'][self.atoms['model'] == model]
+        _, index = np.unique(chains, return_index=True)
+        return [i.decode() or ' ' for i in chains[np.sort(index)]]
+
+    def residue_starts(self):
+        """
+        Index of the first atom of each residue
+        """
+        residue = self.atoms['residue']
+        return np.flatnonzero(np.diff(residue, prepend=residue[:1] - 1))
+
+    def residues(self, model=0, chain=None):
+        """
+        List of Residues in a model, optionally filtered to a chain
+        """
+        atoms = self.atoms[self.residue_starts()]
+        atoms = atoms[atoms['model'] == model]
+        if chain is not None:
+            atoms = atoms[atoms['chain'] == chain.strip().encode()]
+
+        residues = []
+        for hetero, resname, chain_id, resseq, icode in zip(atoms['hetero'], atoms['resname'],
+                                                            atoms['chain'], atoms['resseq'],
+                                                            atoms['icode']):
+            resname = resname.decode()
+            if not hetero:
+                hetflag = ' '
+            elif resname in WATER_NAMES:
+                hetflag = 'W'
+            else:
+                hetflag = f'H_{resname}'
+            residue_id = (hetflag, int(resseq), icode.decode() or ' ')
+            residues.append(Residue((self.name, model, chain_id.decode() or ' ', residue_id),
+                                    residue_id, resname))
+        return residues
+
+class StructureCache:
+    """
+    Directory of parsed PDB files, keyed by content hash. If root is None structures are parsed
+    every time.
+
+    root: Cache directory
+    """
+    def __init__(self, root=None):
+        self.root = Path(root) if root else None
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self):
+        return f'StructureCache({self.root})'
+
+    def path(self, pdb):
+        """
+        Cache file path for a PDB file
+        """
+        return self.root / f'{content_hash(pdb)}.npy'
+
+    def load(self, pdb):
+        """
+        Load a PDB file as a Structure, from the cache if possible. Cached tables are memory
+        mapped.
+        """
+        name = Path(pdb).stem
+        if self.root is None:
+            return Structure(parse_pdb(pdb), name=name)
+
+        path = self.path(pdb)
+        if not path.is_file():
+            atoms = parse_pdb(pdb)
+            tmp_path = path.with_name(f'.{path.stem}.{os.getpid()}.npy')
+            np.save(tmp_path, atoms)
+            os.replace(tmp_path, path)
+        return Structure(np.load(path, mmap_mode='r'), name=name)
+
+def load_structure(pdb, cache=None):
+    """
+    Load a PDB file as a Structure, using a cache directory if given
+    """
+    return StructureCache(cache).load(pdb)
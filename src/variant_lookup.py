@@ -0,0 +1,114 @@
+"""
+Fast lookup of variants in the summary table. The table is loaded once into memory as rows of
+unparsed fields, indexed by (name, position, mut) and (name, position), so single variant
+lookups are a dictionary access.
+"""
+import re
+import gzip
+
+# Alternative protein names accepted in queries, mapped to summary table names
+NAME_ALIASES = {
+    'spike': 's', 'n': 'nc', 'nucleocapsid': 'nc', 'envelope': 'e', 'membrane': 'm',
+    'rdrp': 'nsp12', 'mpro': 'nsp5', '3clpro': 'nsp5', 'plpro': 'nsp3', 'helicase': 'nsp13'
+}
+
+VARIANT_RE = re.compile(r'^(?P<name>[^:]+):(?P<wt>[A-Z*]?)(?P<position>[0-9]+)(?P<mut>[A-Z*]?)$')
+
+def parse_variant(variant):
+    """
+    Parse a variant string in NAME:WTPOSMUT format (e.g. S:D614G) into a tuple of name,
+    position, WT and mutant. WT and mutant are optional and returned as None when missing,
+    and names are case insensitive and can be any alias in NAME_ALIASES.
+    """
+    match = VARIANT_RE.match(variant.strip())
+    if match is None:
+        raise ValueError(f'Could not parse variant "{variant}", expected NAME:WTPOSMUT format')
+
+    name = match['name'].lower()
+    name = NAME_ALIASES.get(name, name)
+    return name, int(match['position']), match['wt'] or None, match['mut'] or None
+
+class VariantIndex:
+    """
+    In memory index of a summary table (see summary_tsv.py), which can be gzipped. Rows are
+    stored as lists of string fields, exactly as in the table.
+
+    path: Summary table
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self.rows = []
+        self.variants = {}
+        self.positions = {}
+
+        open_func = gzip.open if self.path.endswith('.gz') else open
+        with open_func(self.path, 'rt') as summary_file:
+            self.columns = summary_file.readline().rstrip('\n').split('\t')
+            name_col = self.columns.index('name')
+            pos_col = self.columns.index('position')
+            mut_col = self.columns.index('mut')
+            self.wt_col = self.columns.index('wt')
+
+            for line in summary_file:
+                row = line.rstrip('\n').split('\t')
+                name, position = row[name_col], int(row[pos_col])
+                index = len(self.rows)
+                self.rows.append(row)
+                self._extend(self.variants, (name, position, row[mut_col]), index)
+                self._extend(self.positions, (name, position), index)
+
+    @staticmethod
+    def _extend(index, key, row):
+        """
+        Extend the row range for a key, which should cover contiguous rows
+        """
+        start, end = index.get(key, (row, row))
+        if not end == row:
+            raise ValueError(f'Rows for {key} are not contiguous, is the table sorted?')
+        index[key] = (start, row + 1)
+
+    def __repr__(self):
+        return f'VariantIndex({self.path}, rows={len(self.rows)})'
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, name, position, mut=None, wt=None):
+        """
+        Rows for a variant, or all variants at a position if mut is None. Returns an empty
+        list for unknown variants, including when wt is given and does not match the table.
+        """
+        if mut is None:
+            start, end = self.positions.get((name, position), (0, 0))
+        else:
+            start, end = self.variants.get((name, position, mut), (0, 0))
+        rows = self.rows[start:end]
+        if wt is not None:
+            rows = [row for row in rows if row[self.wt_col] == wt]
+        return rows
+
+    def query(self, variant):
+        """
+        Rows for a variant string (see parse_variant)
+        """
+        name, position, wt, mut = parse_variant(variant)
+        return self.lookup(name, position, mut, wt)
+
+    def query_many(self, variants):
+        """
+        Look up a batch of variant strings, returning a list of (variant, rows) tuples.
+        Variants that cannot be parsed return no rows.
+        """
+        results = []
+        for variant in variants:
+            try:
+                results.append((variant, self.query(variant)))
+            except ValueError:
+                results.append((variant, []))
+        return results
+
+    def to_dicts(self, rows):
+        """
+        Convert rows to dictionaries keyed by column name
+        """
+        return [dict(zip(self.columns, row)) for row in rows]
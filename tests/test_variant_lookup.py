@@ -0,0 +1,46 @@
+"""
+Tests for src/variant_lookup.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+import pytest # pylint: disable=wrong-import-position
+from variant_lookup import VariantIndex, parse_variant # pylint: disable=wrong-import-position
+
+SUMMARY = [
+    ['uniprot', 'name', 'position', 'wt', 'mut', 'sift_score'],
+    ['P0DTC2', 's', '614', 'D', 'G', '0.5'],
+    ['P0DTC2', 's', '614', 'D', 'N', '0.1'],
+    ['P0DTC9', 'nc', '203', 'R', 'K', '0.9']
+]
+
+@pytest.fixture(name='index')
+def fixture_index(tmp_path):
+    """Index of a small summary table"""
+    path = tmp_path / 'summary.tsv'
+    path.write_text(''.join('\t'.join(row) + '\n' for row in SUMMARY))
+    return VariantIndex(path)
+
+def test_parse_variant():
+    """Names are normalised and WT and mutant are optional"""
+    assert parse_variant('Spike:D614G') == ('s', 614, 'D', 'G')
+    assert parse_variant('N:203') == ('nc', 203, None, None)
+    with pytest.raises(ValueError):
+        parse_variant('D614G')
+
+def test_query(index):
+    """Variants and positions return their rows"""
+    assert index.query('S:D614G') == [SUMMARY[1]]
+    assert index.query('S:614G') == [SUMMARY[1]]
+    assert index.query('S:614') == SUMMARY[1:3]
+    assert index.query('nc:R203K') == [SUMMARY[3]]
+    assert not index.query('S:D615G')
+
+def test_query_wt_mismatch(index):
+    """Variants with a WT residue not matching the table return no rows"""
+    assert not index.query('S:A614G')
+    assert not index.query('S:A614')
+    assert index.query_many(['S:A614G', 'S:D614G']) == [('S:A614G', []),
+                                                        ('S:D614G', [SUMMARY[1]])]